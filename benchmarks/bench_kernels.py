@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the stepping kernels: row by row sweep of the whole bar
+(:meth:`Segment.compMiddle`, as in :class:`WP2`) versus temporal blocking
+(:class:`tiled.TiledWaveprop`), for bars which fit in cache or not.
+"""
+
+import numpy as np
+from elwaspatid import BarSingle, TiledWaveprop, trapezeWave
+from elwaspatid.elwaspatid import Segment
+
+E = 201e9  # Young modulus [Pa]
+rho = 7800  # Density [kg/m3]
+d = 0.020  # diameter [m]
+nT = 100  # number of time steps
+
+
+class TimeKernels:
+    """Middle of a constant section bar, nT time steps"""
+    params = [10000, 100000, 1000000]
+    param_names = ['nX']
+
+    def setup(self, nX):
+        self.bar = BarSingle(0.01, np.ones(nX)*d, E, rho)
+        self.incw = trapezeWave(plateau=50, rise=10, A=-1e3)
+
+    def time_compMiddle(self, nX):
+        seg = Segment(nX, self.bar.Z[0], E, nX*0.01, 0.01, self.bar.dt, 0, 'impact', 'free')
+        seg.initCalc(nT)
+        for it in range(1, nT):
+            seg.compMiddle(it)
+
+    def time_tiled_nodepth(self, nX):
+        # one time step per sweep, only last row stored
+        TiledWaveprop(self.bar, self.incw, nstep=nT, tile=nX+1, depth=1, rows=[nT-1])
+
+    def time_tiled(self, nX):
+        TiledWaveprop(self.bar, self.incw, nstep=nT, rows=[nT-1])
+
+    def time_tiled_allrows(self, nX):
+        TiledWaveprop(self.bar, self.incw, nstep=nT)
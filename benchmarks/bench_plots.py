@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the plotting methods (non interactive Agg backend).
+"""
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+from elwaspatid import Waveprop, WP2, BarSingle, BarSet
+
+E = 201e9  # Young modulus [Pa]
+rho = 7800  # Density [kg/m3]
+d = 0.020  # diameter [m]
+
+
+class TimeWP2Plots:
+    """Plotting of :class:`WP2` results"""
+    params = [10, 100]
+    param_names = ['nmin']
+
+    def setup(self, nmin):
+        bar = BarSet([E, E], [rho, rho], [1, 0.5], [d, 1.5*d], nmin=nmin)
+        self.prop = WP2(bar, nstep=20*nmin, right='infinite', Vinit=5)
+
+    def teardown(self, nmin):
+        plt.close('all')
+
+    def time_plotForce(self, nmin):
+        self.prop.plotForce()
+        plt.gcf().canvas.draw()
+
+    def time_subplot(self, nmin):
+        self.prop.subplot(typ='Veloc')
+        plt.gcf().canvas.draw()
+
+    def time_plotDeSaintVenant(self, nmin):
+        self.prop.plotDeSaintVenant()
+        plt.gcf().canvas.draw()
+
+    def peakmem_plot(self, nmin):
+        self.prop.plot(typ='FVD')
+
+
+class TimeWavepropPlots:
+    """Plotting of :class:`Waveprop` results"""
+    params = [100, 1000]
+    param_names = ['nX']
+
+    def setup(self, nX):
+        bar = BarSingle(0.01, np.ones(nX)*d, E, rho)
+        self.prop = Waveprop(bar, -np.ones(20), nstep=2*nX)
+
+    def teardown(self, nX):
+        plt.close('all')
+
+    def time_plot(self, nX):
+        self.prop.plot(typ='F')
+        plt.gcf().canvas.draw()
+
+    def time_plotDeSaintVenant(self, nX):
+        self.prop.plotDeSaintVenant()
+        plt.gcf().canvas.draw()
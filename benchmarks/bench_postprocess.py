@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of post-processing of :class:`WP2` and :class:`Waveprop` results.
+"""
+
+import numpy as np
+from elwaspatid import Waveprop, WP2, BarSingle, BarSet
+
+E = 201e9  # Young modulus [Pa]
+rho = 7800  # Density [kg/m3]
+d = 0.020  # diameter [m]
+
+
+class TimeWP2Post:
+    """Post-processing of :class:`WP2` results"""
+    params = [10, 100, 1000]
+    param_names = ['nmin']
+
+    def setup(self, nmin):
+        bar = BarSet([E, E, E], [rho, rho, rho], [1, 0.5, 1], [d, 1.5*d, d], nmin=nmin)
+        self.prop = WP2(bar, nstep=20*nmin, right='infinite', Vinit=5)
+
+    def time_getSignal(self, nmin):
+        self.prop.getSignal(x=1.2, plot=False)
+
+    def time_getSignal_iseg(self, nmin):
+        self.prop.getSignal(x=0.25, iseg=1, plot=False)
+
+    def time_gatherForce(self, nmin):
+        self.prop.gatherForce()
+
+    def peakmem_gatherForce(self, nmin):
+        self.prop.gatherForce()
+
+    def time_computeStressStrain(self, nmin):
+        for ss in self.prop.bar.seg:
+            ss.computeStressStrain()
+
+
+class TimeWavepropPost:
+    """Post-processing of :class:`Waveprop` results"""
+    params = [100, 1000]
+    param_names = ['nX']
+
+    def setup(self, nX):
+        bar = BarSingle(0.01, np.ones(nX)*d, E, rho)
+        self.prop = Waveprop(bar, -np.ones(20), nstep=2*nX)
+
+    def time_getcut_x(self, nX):
+        self.prop.getcut(x=0.5)
+
+    def time_getcut_t(self, nX):
+        self.prop.getcut(t=self.prop.time[-1]/2)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the solvers: :class:`Waveprop`, :class:`WP2` and
+:class:`transfer.TransferMatrix`.
+
+Time and peak memory are measured for several sizes of the problem: number of
+nodes (nX), number of time steps (nT) and number of Segments (nseg, grooved
+bars built with :func:`groovedBar`).
+"""
+
+import numpy as np
+from elwaspatid import Waveprop, WP2, BarSingle, BarSet, groovedBar, trapezeWave
+from elwaspatid import TransferMatrix, ParallelWaveprop
+
+E = 201e9  # Young modulus [Pa]
+rho = 7800  # Density [kg/m3]
+d = 0.020  # diameter [m]
+
+
+class TimeWaveprop:
+    """:class:`Waveprop` on a constant section bar"""
+    params = ([100, 1000, 10000], [200, 2000])
+    param_names = ['nX', 'nT']
+
+    def setup(self, nX, nT):
+        self.bar = BarSingle(0.01, np.ones(nX)*d, E, rho)
+        self.incw = trapezeWave(plateau=50, rise=10, A=-1e3)
+
+    def time_Waveprop(self, nX, nT):
+        Waveprop(self.bar, self.incw, nstep=nT, left='free', right='free')
+
+    def peakmem_Waveprop(self, nX, nT):
+        Waveprop(self.bar, self.incw, nstep=nT, left='free', right='free')
+
+
+class TimeActivity:
+    """Short pulse in a long bar, with and without tracking of the active nodes
+    (tolerance 0: overhead of the tracking, 1e-6 N: span shrinking behind the pulse)"""
+    params = ([10000], [None, 0, 1e-6])
+    param_names = ['nX', 'activity']
+
+    def setup(self, nX, activity):
+        self.bar = BarSingle(0.01, np.ones(nX)*d, E, rho)
+        self.incw = trapezeWave(plateau=20, rise=5, A=-1e3)
+        self.barset = BarSet([E], [rho], [nX*0.01], [d], nmin=nX)
+
+    def time_Waveprop(self, nX, activity):
+        Waveprop(self.bar, self.incw, nstep=500, activity=activity)
+
+    def time_WP2(self, nX, activity):
+        WP2(self.barset, self.incw, nstep=500, activity=activity)
+
+
+class TimeParallelWaveprop:
+    """:class:`parallel.ParallelWaveprop` on a long constant section bar"""
+    params = ([100000, 1000000], [1, 2, 4], [1, 16])
+    param_names = ['nX', 'nproc', 'sync']
+
+    def setup(self, nX, nproc, sync):
+        self.bar = BarSingle(0.01, np.ones(nX)*d, E, rho)
+        self.incw = trapezeWave(plateau=50, rise=10, A=-1e3)
+
+    def time_ParallelWaveprop(self, nX, nproc, sync):
+        ParallelWaveprop(self.bar, self.incw, nstep=200, nproc=nproc, sync=sync, nodes=[0, nX//2])
+
+
+class TimeWP2:
+    """:class:`WP2` on two bars in contact"""
+    params = ([10, 100, 1000], [200, 2000], [True, False])
+    param_names = ['nmin', 'nT', 'contactLoss']
+
+    def setup(self, nmin, nT, contactLoss):
+        self.bar = BarSet([E, E], [rho, rho], [1, 0.5], [d, 1.5*d], nmin=nmin)
+        self.contactLoss = 1e-9 if contactLoss else None
+
+    def time_WP2(self, nmin, nT, contactLoss):
+        WP2(self.bar, nstep=nT, right='infinite', Vinit=5, contactLoss=self.contactLoss)
+
+    def peakmem_WP2(self, nmin, nT, contactLoss):
+        WP2(self.bar, nstep=nT, right='infinite', Vinit=5, contactLoss=self.contactLoss)
+
+
+class TimeWP2Segments:
+    """:class:`WP2` on grooved bars: many Segments, few nodes in each"""
+    params = ([2, 10, 50], [True, False])
+    param_names = ['ngroove', 'contactLoss']
+
+    def setup(self, ngroove, contactLoss):
+        self.bar, _ = groovedBar([0.6/ngroove]*ngroove, LL=1.2)
+        self.contactLoss = 1e-9 if contactLoss else None
+
+    def time_WP2(self, ngroove, contactLoss):
+        WP2(self.bar, nstep=1000, right='infinite', Vinit=5, contactLoss=self.contactLoss)
+
+    def peakmem_WP2(self, ngroove, contactLoss):
+        WP2(self.bar, nstep=1000, right='infinite', Vinit=5, contactLoss=self.contactLoss)
+
+
+class TimeTransferMatrix:
+    """:class:`transfer.TransferMatrix` on two bars, signals at two positions"""
+    params = ([200, 2000, 200000], [2, 100])
+    param_names = ['nT', 'nsensor']
+
+    def setup(self, nT, nsensor):
+        self.bar = BarSet([E, E], [rho, rho], [1, 0.5], [d, 1.5*d], nmin=10)
+        self.incw = trapezeWave(plateau=50, rise=10, A=-1e3)
+        self.x = np.linspace(0, 1.5, nsensor)
+
+    def time_TransferMatrix(self, nT, nsensor):
+        tm = TransferMatrix(self.bar, self.incw, nstep=nT)
+        tm.getSignal(self.x, plot=False)
+
+    def peakmem_TransferMatrix(self, nT, nsensor):
+        tm = TransferMatrix(self.bar, self.incw, nstep=nT)
+        tm.getSignal(self.x, plot=False)
@@ -10,7 +10,7 @@ result given by :class:`ElasticImpact` and the numerical result computed with
 
 import numpy as np
 import matplotlib.pyplot as plt
-from elwaspatid import WP2, BarSet, ElasticImpact
+from elwaspatid import WP2, BarSet, ElasticImpact, Striker
 
 
 # %%
@@ -73,4 +73,22 @@ plt.plot(time, -EK.force, '--', label='ana')
 plt.legend()
 plt.xlim(xmax=2.7e-3)
 
+
+# %%
+# Analytical striker boundary condition
+# -------------------------------------
+# The striker does not need to be discretized: :class:`Striker` gives the
+# contact force as a left boundary condition, until the striker separates.
+bar = BarSet([E], [rho], [.2], [d1], nmin=6, right='infinite')
+striker = Striker(E, rho, d2, L, Vo)
+tests = WP2(bar, nstep=400, left=striker, right='infinite')
+f2, v2, x2, ind2 = tests.getSignal(x=0, iseg=0, plot=False)
+print('Separation of the striker at t=%s s'%tests.boundary['left'].tsep)  # None: still in contact
+
+plt.figure()
+plt.plot(testk.time, f1, '-', label='discretized striker')
+plt.plot(tests.time, f2, '--', label='Striker boundary')
+plt.legend()
+plt.xlim(xmax=2.7e-3)
+
 plt.show()
@@ -8,7 +8,7 @@ purely elastic behaviour.
 """
 
 import matplotlib.pyplot as plt
-from elwaspatid import WP2, BarSet
+from elwaspatid import WP2, BarSet, SHPB
 
 
 # %%
@@ -39,4 +39,14 @@ plt.plot(testk.time*1e6, -f2/1000, '-', label='right')
 plt.xlabel('time [µs]')
 plt.ylabel('force [kN]')
 plt.legend()
+
+
+# %%
+# Classical SHPB analysis with virtual gauges in the middle of the input and
+# output bars: the waves are shifted to the faces of the sample, which gives
+# the 1-wave, 2-wave and 3-wave forces, the strain rate and the stress-strain
+# curve of the sample.
+shpb = SHPB.fromWP2(testk, isample=2)
+shpb.plot(figname='SHPB analysis')
+print('Equilibrium during %.0f%% of the loading'%(100*shpb.equilibrium()[0]))
 plt.show()
\ No newline at end of file
@@ -133,10 +133,9 @@ setup(
     #
     # Similar to `install_requires` above, these must be valid existing
     # projects.
-#    extras_require={  # Optional
-#        "dev": ["check-manifest"],
-#        "test": ["coverage"],
-#    },
+    extras_require={  # Optional
+        "hdf5": ["h5py"],
+    },
     # If there are data files included in your packages that need to be
     # installed, specify them here.
 #    package_data={  # Optional
@@ -1,3 +1,18 @@
 from .elwaspatid import Waveprop, WP2, BarSingle, BarSet, ElasticImpact
+from .elwaspatid import Bonded, Contact, Workspace
 # from .elwaspatid import Bar, Segment  # These class are not called directly by the used
 from .elwaspatid import trapezeWave, groovedBar
+from .storage import save, load, opened
+from .cache import SimulationCache
+from .compressed import compress
+from .boundaries import Striker, Lumped, Spring, Dashpot, Mass, Friction
+from .measure import GaugeRecord, IncidentWave
+from .shpb import SHPB
+from .separation import WaveSeparation
+from .dispersion import Dispersion
+from .transfer import TransferMatrix
+from .inverse import layerPeeling
+from .adjoint import Adjoint
+from .montecarlo import MonteCarlo
+from .parallel import ParallelWaveprop
+from .tiled import TiledWaveprop
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Gradients of an objective with respect to the impedances of the elements and
+to the incident wave, by the adjoint method.
+
+The schemes of :class:`Waveprop` and :class:`WP2` are linear with respect to
+the incident wave, and explicit: the gradient of a scalar objective J
+computed from the Force and Velocity histories is obtained by one backward
+run through the time steps of the forward computation (reverse mode
+differentiation)::
+
+    prop = WP2(bar, incw, nstep=1000, contactLoss=None)
+    adj = Adjoint(prop)
+    J, gZ, gincw = adj.mismatch(target, ind=120)  # force at gauge vs target
+    # or, for any objective J(Force, Veloc):
+    gZ, gincw = adj.gradient(dJdF, dJdV)
+
+For :class:`WP2`, the state of the interfaces (contact or not) is the one of
+the forward computation: the gradient is the one of the active branch.
+Viscoelastic Segments (:meth:`BarSet.setViscoelastic`) are not supported.
+"""
+
+import numpy as np
+
+from .elwaspatid import ViscoSegment
+
+
+class Adjoint:
+    """Adjoint (backward) run of a :class:`Waveprop` or :class:`WP2` computation.
+
+    :attr:`Z` gathers the impedances of all the elements (in the order of the
+    Segments for :class:`WP2`), gradients are given in the same order.
+    """
+
+    def __init__(self, prop):
+        """
+
+        :param obj prop: computed :class:`Waveprop` or :class:`WP2` object
+        """
+        bound = prop.boundary
+        for bc in (bound['left'], bound['right']):
+            if not isinstance(bc, str):
+                raise NotImplementedError("Adjoint of boundary objects")
+        self.prop = prop
+        self.incw = np.asarray(prop.incw, dtype=float)
+        if hasattr(prop, 'indF'):
+            # WP2: one chain of nodes per Segment
+            segs = prop.bar.seg
+            for ii, ss in enumerate(segs):
+                if isinstance(ss, ViscoSegment):
+                    raise NotImplementedError("Adjoint of viscoelastic Segment %i"%ii)
+            nExc = 0 if bound['Vinit'] else len(self.incw)  # Vinit supersedes incw
+            # bonded interfaces (see :class:`Bonded`) transmit traction
+            laws = getattr(prop, 'interfaces', [None]*(len(segs)-1))
+            names = [law['class'] if isinstance(law, dict) else type(law).__name__ for law in laws]
+            bonded = [nn=='Bonded' for nn in names] + [False]
+            self.chains = []
+            for ii, ss in enumerate(segs):
+                self.chains.append({'Z':ss.Z, 'iF':prop.indF[ii], 'iV':prop.indV[ii], 'nX':ss.nX,
+                                    'left':bound['left'] if ii==0 else 'interf',
+                                    'right':bound['right'] if ii==len(segs)-1 else 'interf',
+                                    'bonded':bonded[ii]})
+            self.Force = prop._Force
+            self.Veloc = prop.Veloc
+        else:
+            # Waveprop: a single chain of nodes
+            if bound['Vinit']:
+                raise NotImplementedError("Adjoint of Waveprop with initial velocity")
+            nExc = len(self.incw)
+            Z = prop.bar_discret.Z
+            self.chains = [{'Z':Z, 'iF':0, 'iV':0, 'nX':len(Z)+1, 'left':bound['left'],
+                            'right':bound['right']}]
+            self.Force = prop.Force
+            self.Veloc = prop.Veloc
+        self.nExc = nExc
+        self.Z = np.hstack([ch['Z'] for ch in self.chains])
+
+    def gradient(self, dJdF, dJdV=None):
+        """Gradient of the objective, given its derivatives with respect to the
+        Force and Velocity histories.
+
+        :param array dJdF: derivative of the objective with respect to :attr:`Force` (same shape)
+        :param array dJdV: derivative of the objective with respect to :attr:`Veloc` (same shape)
+        :returns: gradients with respect to :attr:`Z` and to the incident wave
+        """
+        F = self.Force
+        V = self.Veloc
+        nT = F.shape[0]
+        lam = np.array(dJdF, dtype=float)  # adjoint of Force
+        mu = np.zeros(V.shape) if dJdV is None else np.array(dJdV, dtype=float)  # adjoint of Veloc
+        gZ = np.zeros(len(self.Z))
+        gincw = np.zeros(len(self.incw))
+        ch = self.chains
+        iZ = np.cumsum([0]+[len(cc['Z']) for cc in ch])
+
+        for it in range(nT-1, 0, -1):
+            for ii, cc in enumerate(ch):
+                sF = slice(cc['iF'], cc['iF']+cc['nX'])
+                sV = slice(cc['iV'], cc['iV']+cc['nX'])
+                Fs, Vs, ls, ms = F[:, sF], V[:, sV], lam[:, sF], mu[:, sV]
+                Z = cc['Z']
+                gz = gZ[iZ[ii]:iZ[ii+1]]
+                _middle(it, Fs, Vs, ls, ms, Z, gz)
+                # LEFT end
+                if ii==0 and it<=self.nExc:
+                    gincw[it-1] += _impact(it, Fs, Vs, ls, ms, Z, gz, self.incw[it-1])
+                elif cc['left']=='interf':
+                    # the interface force is written last by this Segment
+                    pc = ch[ii-1]
+                    _interf(it, F[:, pc['iF']:pc['iF']+pc['nX']], V[:, pc['iV']:pc['iV']+pc['nX']],
+                            lam[:, pc['iF']:pc['iF']+pc['nX']], mu[:, pc['iV']:pc['iV']+pc['nX']],
+                            pc['Z'], gZ[iZ[ii-1]:iZ[ii]], Fs, Vs, ls, ms, Z, gz,
+                            Fs[it, 0], ls[it, 0], ms[it, 0], side='right', bonded=pc['bonded'])
+                else:
+                    _left(it, Fs, Vs, ls, ms, Z, gz, cc['left'])
+                # RIGHT end
+                if cc['right']=='interf':
+                    # only velocity: force of the shared node is rewritten by the next Segment
+                    nc = ch[ii+1]
+                    _interf(it, Fs, Vs, ls, ms, Z, gz,
+                            F[:, nc['iF']:nc['iF']+nc['nX']], V[:, nc['iV']:nc['iV']+nc['nX']],
+                            lam[:, nc['iF']:nc['iF']+nc['nX']], mu[:, nc['iV']:nc['iV']+nc['nX']],
+                            nc['Z'], gZ[iZ[ii+1]:iZ[ii+2]],
+                            Fs[it, -1], 0., ms[it, -1], side='left', bonded=cc['bonded'])
+                else:
+                    _right(it, Fs, Vs, ls, ms, Z, gz, cc['right'])
+        return gZ, gincw
+
+    def mismatch(self, target, ind, field='Force'):
+        """Objective J = 1/2 sum (signal - target)² at a gauge, and its gradient.
+
+        :param array target: target signal (length: number of time steps)
+        :param int ind: column of the gauge in :attr:`Force` (or :attr:`Veloc`)
+        :param str field: 'Force' or 'Veloc'
+        :returns: J, gradient with respect to :attr:`Z`, gradient with respect to the incident wave
+        """
+        arr = self.Force if field=='Force' else self.Veloc
+        res = arr[:, ind] - target
+        dJ = np.zeros(arr.shape)
+        dJ[:, ind] = res
+        if field=='Force':
+            gZ, gincw = self.gradient(dJ)
+        else:
+            gZ, gincw = self.gradient(np.zeros(self.Force.shape), dJ)
+        return 0.5*np.sum(res**2), gZ, gincw
+
+
+#---ADJOINT OF THE SCHEME---
+# Each function adds the contributions of the nodes computed at time index it
+# to the adjoint variables at it-1 (lam, mu) and to the gradient gz.
+
+def _middle(it, F, V, lam, mu, Z, gz):
+    """Adjoint of :meth:`Segment.compMiddle` (and middle of :class:`Waveprop`)"""
+    a = Z[:-1]
+    b = Z[1:]
+    S = a + b
+    Fl, Fr = F[it-1, :-2], F[it-1, 2:]
+    Vl, Vr = V[it-1, :-2], V[it-1, 2:]
+    l, m = lam[it, 1:-1], mu[it, 1:-1]
+    lam[it-1, :-2] += (l*b - m)/S
+    lam[it-1, 2:] += (l*a + m)/S
+    mu[it-1, :-2] += (m*a - l*a*b)/S
+    mu[it-1, 2:] += (l*a*b + m*b)/S
+    Fo, Vo = F[it, 1:-1], V[it, 1:-1]
+    gz[:-1] += (l*(Fr + b*(Vr-Vl) - Fo) + m*(Vl - Vo))/S
+    gz[1:] += (l*(Fl + a*(Vr-Vl) - Fo) + m*(Vr - Vo))/S
+
+
+def _impact(it, F, V, lam, mu, Z, gz, u):
+    """Adjoint of the impacted left end, returns the gradient wrt the incident wave"""
+    Z0, Z1 = Z[0], Z[1]
+    S = Z0 + Z1
+    F1, V1 = F[it-1, 1], V[it-1, 1]
+    l, m = lam[it, 0], mu[it, 0]
+    lam[it-1, 1] += (l*Z0 + m)/S
+    mu[it-1, 1] += (l*Z0 + m)*Z1/S
+    gz[0] += (l*(F1 + Z1*V1 - F[it, 0]) - m*V[it, 0])/S
+    gz[1] += (l*(2*u + Z0*V1 - F[it, 0]) + m*(V1 - V[it, 0]))/S
+    return 2*(l*Z1 - m)/S
+
+
+def _left(it, F, V, lam, mu, Z, gz, left):
+    """Adjoint of the left end boundary conditions"""
+    F1, V1 = F[it-1, 1], V[it-1, 1]
+    l, m = lam[it, 0], mu[it, 0]
+    if left=='free':
+        lam[it-1, 1] += m/Z[0]
+        mu[it-1, 1] += m
+        gz[0] -= m*F1/Z[0]**2
+    elif left in ('fixed', 'clamped'):
+        lam[it-1, 1] += l
+        mu[it-1, 1] -= l*Z[0]
+        gz[0] -= l*V1
+    elif left=='infinite':
+        W = F1 + Z[0]*V1
+        gW = l/2 + m/(2*Z[0])
+        lam[it-1, 1] += gW
+        mu[it-1, 1] += gW*Z[0]
+        gz[0] += gW*V1 - m*W/(2*Z[0]**2)
+    else:
+        raise NotImplementedError("Adjoint of '%s' left boundary"%left)
+
+
+def _right(it, F, V, lam, mu, Z, gz, right):
+    """Adjoint of the right end boundary conditions"""
+    Fm, Vm = F[it-1, -2], V[it-1, -2]
+    l, m = lam[it, -1], mu[it, -1]
+    Z = Z[-1]
+    if right=='free':
+        lam[it-1, -2] -= m/Z
+        mu[it-1, -2] += m
+        gz[-1] += m*Fm/Z**2
+    elif right=='infinite':
+        lam[it-1, -2] += l/2 - m/(2*Z)
+        mu[it-1, -2] += (m - l*Z)/2
+        gz[-1] += -l*Vm/2 + m*Fm/(2*Z**2)
+    elif right in ('fixed', 'clamped'):
+        lam[it-1, -2] += l
+        mu[it-1, -2] -= l*Z
+        gz[-1] -= l*Vm
+    else:
+        raise NotImplementedError("Adjoint of '%s' right boundary"%right)
+
+
+def _interf(it, Fa, Va, la, ma, Za, ga, Fb, Vb, lb, mb, Zb, gb, Fo, l, m, side, bonded=False):
+    """Adjoint of the interface between Segments a (left) and b (right).
+
+    :param float Fo: interface force (0 if the contact was lost)
+    :param float l: adjoint of the interface force
+    :param float m: adjoint of the velocity of the node of Segment **side**
+    :param str side: 'left' (last node of a) or 'right' (first node of b)
+    :param bool bonded: bonded interface (traction is transmitted)
+    """
+    Zi, Zii = Za[-1], Zb[0]
+    Fl, Vl = Fa[it-1, -2], Va[it-1, -2]
+    Fr, Vr = Fb[it-1, 1], Vb[it-1, 1]
+    if Fo<0 or bonded:
+        # compression: same as the middle of a Segment
+        S = Zi + Zii
+        Vo = (Fr - Fl + Zi*Vl + Zii*Vr)/S
+        la[it-1, -2] += (l*Zii - m)/S
+        lb[it-1, 1] += (l*Zi + m)/S
+        ma[it-1, -2] += (m*Zi - l*Zi*Zii)/S
+        mb[it-1, 1] += (l*Zi*Zii + m*Zii)/S
+        ga[-1] += (l*(Fr + Zii*(Vr-Vl) - Fo) + m*(Vl - Vo))/S
+        gb[0] += (l*(Fl + Zi*(Vr-Vl) - Fo) + m*(Vr - Vo))/S
+    elif side=='left':
+        # traction: free right end of Segment a
+        la[it-1, -2] -= m/Zi
+        ma[it-1, -2] += m
+        ga[-1] += m*Fl/Zi**2
+    else:
+        # traction: free left end of Segment b
+        lb[it-1, 1] += m/Zii
+        mb[it-1, 1] += m
+        gb[0] -= m*Fr/Zii**2
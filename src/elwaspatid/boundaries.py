@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Boundary conditions given as objects, for the **left** and **right**
+arguments of :class:`WP2` and :class:`Waveprop`, in place of the usual
+strings ('free', 'infinite'...)::
+
+    bar = BarSet([E, E], [rho, rho], [3, .05], [0.030, 0.025], nmin=4)
+    test = WP2(bar, nstep=400, left=Striker(E, rho, 0.028, 0.6, V=5))
+
+A boundary object has two methods, called by the solvers:
+
+* ``initCalc(dt, nT)``: reset its state before a computation;
+* ``compEnd(it, W, Z)``: compute force and velocity of the bar end at time
+  index **it**, knowing the invariant **W** arriving from the bar and the
+  impedance **Z** of the bar end.
+
+Everything is written for a left end: **W** is the leftgoing invariant
+F+ZV, the returned velocity is positive towards the bar. The solvers mirror
+the velocities for a right end.
+
+Available boundaries: :class:`Striker` (elastic impactor), and lumped
+elements (:class:`Spring`, :class:`Dashpot`, :class:`Mass`,
+:class:`Friction`, or a combination of them with :class:`Lumped`)::
+
+    prop = Waveprop(bar, incw, nstep=2000, right=Lumped(M=0.5, K=1e7, C=50))
+"""
+
+import numpy as np
+
+
+class Boundary:
+    """Base class of boundary objects.
+
+    :attr:`parameters` (the arguments of the constructor) describe the
+    boundary, eg. for :class:`cache.SimulationCache` keys.
+    """
+    _param = ()  # names of the parameters of the boundary
+
+    def initCalc(self, dt, nT):
+        """Initialize the boundary before the computation.
+
+        :param float dt: time step [s]
+        :param int nT: number of time steps
+        """
+        self.dt = dt
+
+    def compEnd(self, it, W, Z):
+        """Compute force and velocity of the bar end
+
+        :param int it: time index
+        :param float W: invariant arriving from the bar (F+ZV at the node next to the end, previous time step)
+        :param float Z: impedance of the bar end
+        :returns: force, velocity
+        """
+        raise NotImplementedError
+
+    @property
+    def parameters(self):
+        """Parameters of the boundary (dict)"""
+        return {pp:getattr(self, pp) for pp in self._param}
+
+    def __repr__(self):
+        return '%s(%s)'%(type(self).__name__,
+                         ', '.join(['%s=%r'%(kk, vv) for kk, vv in self.parameters.items()]))
+
+
+class Striker(Boundary):
+    """Elastic striker (uniform cylinder) impacting the bar end.
+
+    The striker is not discretized: the wave going into the striker comes
+    back to the contact after the time :math:`t_e=2L/c`, with opposite sign
+    (free rear end of the striker). This is the analytical solution of
+    :class:`ElasticImpact`, sampled on the time grid of the solver: it is
+    recovered exactly at the end of a bar of constant section.
+
+    As long as contact holds (compressive force), the force results from the
+    striker and bar waves. When the force would become a traction, the striker
+    separates and the bar end is then free.
+    """
+    _param = ('E', 'rho', 'd', 'L', 'V')
+
+    def __init__(self, E=210e9, rho=7800, d=0.03, L=1., V=5.):
+        """
+
+        :param float E: Young's modulus of the striker [Pa]
+        :param float rho: density of the striker [kg/m3]
+        :param float d: diameter of the striker [m]
+        :param float L: length of the striker [m]
+        :param float V: impact velocity (towards the bar) [m/s]
+        """
+        self.E = E
+        self.rho = rho
+        self.d = d
+        self.L = L
+        self.V = V
+        #---COMPUTE A FEW PARAMETERS---
+        self.c = np.sqrt(E/rho)
+        self.A = np.pi*d*d/4
+        self.Z = self.A*np.sqrt(E*rho)
+        self.te = 2*L/self.c
+
+    def initCalc(self, dt, nT):
+        """Initialize the striker: in contact, with velocity :attr:`V`
+
+        :param float dt: time step [s]
+        :param int nT: number of time steps
+        """
+        self.dt = dt
+        self.nte = self.te/dt  # round trip in the striker [time steps]
+        if self.nte<1:
+            raise ValueError("Striker shorter than half the length of an element")
+        # invariant F+Zs*V leaving the contact towards the striker. Striker
+        # in uniform motion (F=0, V) before impact.
+        self.Lout = np.full(nT, self.Z*self.V)
+        self.contact = True
+        self.itsep = None  # time index of separation
+
+    def compEnd(self, it, W, Z):
+        """Compute force and velocity of the impacted bar end
+
+        :param int it: time index
+        :param float W: invariant arriving from the bar (F+ZV)
+        :param float Z: impedance of the bar end
+        :returns: force, velocity
+        """
+        if self.contact:
+            # invariant F-Zs*V coming back from the free end of the striker
+            tt = it - self.nte
+            if tt<=0:
+                R = -self.Lout[0]
+            else:
+                i0 = int(tt)  # linear interpolation between time steps
+                R = -((1-tt+i0)*self.Lout[i0] + (tt-i0)*self.Lout[min(i0+1, it-1)])
+            F = (Z*R + self.Z*W)/(self.Z + Z)
+            if F<0:
+                V = (W - R)/(self.Z + Z)
+                self.Lout[it] = F + self.Z*V
+                return F, V
+            # traction: the striker separates from the bar
+            self.contact = False
+            self.itsep = it
+        return 0, W/Z
+
+    @property
+    def tsep(self):
+        """Time of separation of the striker [s] (None if still in contact)"""
+        if self.itsep is None:
+            return None
+        return self.itsep*self.dt
+
+
+class Lumped(Boundary):
+    """Lumped element at the bar end: mass **M**, linked to a rigid support by
+    a spring **K**, a dashpot **C** and Coulomb friction **Ff** in parallel.
+
+    The motion of the end is integrated in O(1) per time step (backward
+    Euler for the mass and dashpot, trapezoidal rule for the spring), only
+    the current displacement and velocity are kept. When the friction
+    sticks, the bar end does not move.
+
+    All parameters null gives a free end. See also :class:`Spring`,
+    :class:`Dashpot`, :class:`Mass` and :class:`Friction`.
+    """
+    _param = ('M', 'K', 'C', 'Ff')
+
+    def __init__(self, M=0., K=0., C=0., Ff=0.):
+        """
+
+        :param float M: mass of the end [kg]
+        :param float K: stiffness of the spring [N/m]
+        :param float C: damping coefficient of the dashpot [N.s/m]
+        :param float Ff: friction force (sliding threshold) [N]
+        """
+        self.M = M
+        self.K = K
+        self.C = C
+        self.Ff = Ff
+
+    def initCalc(self, dt, nT):
+        """Initialize the element: at rest, spring not stretched
+
+        :param float dt: time step [s]
+        :param int nT: number of time steps
+        """
+        self.dt = dt
+        self.u = 0.  # displacement of the end (towards the bar)
+        self.V = 0.  # velocity of the end (towards the bar)
+        self.stick = self.Ff>0  # friction sticking or not
+
+    def compEnd(self, it, W, Z):
+        """Compute force and velocity of the bar end
+
+        The force of the bar F=W-ZV balances the inertia of the mass and the
+        forces of the spring, dashpot and friction.
+
+        :param int it: time index
+        :param float W: invariant arriving from the bar (F+ZV)
+        :param float Z: impedance of the bar end
+        :returns: force, velocity
+        """
+        dt = self.dt
+        # forces on the end without friction, for a null velocity
+        R = self.M*self.V/dt + W - self.K*(self.u + dt/2*self.V)
+        self.stick = abs(R)<=self.Ff
+        if self.stick:
+            V = 0.
+        else:
+            V = (R - np.sign(R)*self.Ff)/(self.M/dt + Z + self.K*dt/2 + self.C)
+        self.u += dt/2*(self.V + V)
+        self.V = V
+        return W - Z*V, V
+
+
+class Spring(Lumped):
+    """Bar end linked to a rigid support by a linear spring."""
+    _param = ('K',)
+
+    def __init__(self, K=1e8):
+        """
+
+        :param float K: stiffness of the spring [N/m]
+        """
+        Lumped.__init__(self, K=K)
+
+
+class Dashpot(Lumped):
+    """Bar end linked to a rigid support by a linear dashpot."""
+    _param = ('C',)
+
+    def __init__(self, C=1e4):
+        """
+
+        :param float C: damping coefficient [N.s/m]
+        """
+        Lumped.__init__(self, C=C)
+
+
+class Mass(Lumped):
+    """Rigid mass at the bar end."""
+    _param = ('M',)
+
+    def __init__(self, M=1.):
+        """
+
+        :param float M: mass [kg]
+        """
+        Lumped.__init__(self, M=M)
+
+
+class Friction(Lumped):
+    """Bar end held by Coulomb friction: it does not move until the force
+    reaches the friction threshold.
+    """
+    _param = ('Ff',)
+
+    def __init__(self, Ff=1e4):
+        """
+
+        :param float Ff: friction force [N]
+        """
+        Lumped.__init__(self, Ff=Ff)
+
+
+def lumpedEnd(name):
+    """Lumped element from the former string boundary conditions of
+    :class:`Waveprop`: 'spring', 'damped' and 'friction', which can be
+    combined (eg. 'spring-damped'). Default parameters of :class:`Spring`,
+    :class:`Dashpot` and :class:`Friction` are used.
+
+    :param str name: boundary condition
+    :returns: :class:`Lumped` instance
+    """
+    kw = {}
+    if 'spring' in name:
+        kw['K'] = Spring().K
+    if 'damp' in name:
+        kw['C'] = Dashpot().C
+    if 'friction' in name:
+        kw['Ff'] = Friction().Ff
+    if not kw:
+        raise ValueError("Boundary condition '%s' not available"%name)
+    return Lumped(**kw)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of :class:`WP2` and :class:`Waveprop` computations.
+
+Identical computations (same discretized bar, incident wave, number of time
+steps, boundary conditions...) are only run once, the results are then read
+from the cache directory::
+
+    cache = SimulationCache('~/.cache/elwaspatid', maxsize=2e9)
+    prop = cache.WP2(bar, incw, nstep=1000, right='infinite')  # computed
+    prop = cache.WP2(bar, incw, nstep=1000, right='infinite')  # read from cache
+    print(cache.stats)
+
+Results are stored with :func:`storage.save` in ``.npz`` format, and are
+memory-mapped when read from the cache. The least recently used entries are
+removed when the size of the cache exceeds **maxsize**.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+
+import numpy as np
+
+from .elwaspatid import WP2, Waveprop
+from .storage import save, load, _flatten, _jsonDefault, SEGRESULTS
+
+#: change to invalidate existing cache entries (eg. when the solvers change)
+CACHE_VERSION = 1
+
+
+class SimulationCache:
+    """Content-addressed cache of :class:`WP2` and :class:`Waveprop` results.
+
+    The key of an entry is a hash of the discretized bar (E, rho, Z, dx, dt,
+    nelt, Segment impedances after :meth:`BarSet.changeSection`...), of the
+    incident wave and of all the other arguments of the solver.
+    """
+
+    def __init__(self, path, maxsize=1e9):
+        """
+
+        :param str path: cache directory (created if needed)
+        :param float maxsize: maximum size of the cache [bytes]
+        """
+        path = os.path.expanduser(path)
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, solver, bar, incw=None, **kwargs):
+        """Compute the key of a computation.
+
+        :param class solver: :class:`WP2` or :class:`Waveprop`
+        :param obj bar: :class:`BarSet` or :class:`BarSingle`
+        :param array incw: incident wave
+        :param kwargs: other arguments given to **solver**
+        """
+        # all the arguments, with default values
+        args = inspect.signature(solver).bind(bar, incw, **kwargs)
+        args.apply_defaults()
+        args = dict(args.arguments)
+        del args['bar'], args['incw']
+        args.pop('workspace', None)  # same results with or without workspace
+
+        arrays = {}
+        barmeta = _flatten(bar, '', arrays, exclude=SEGRESULTS)
+        h = hashlib.sha256()
+        h.update(json.dumps([CACHE_VERSION, solver.__name__, args, barmeta],
+                            sort_keys=True, default=_jsonDefault).encode())
+        for name in sorted(arrays):
+            _hashArray(h, arrays[name])
+        _hashArray(h, np.zeros(0) if incw is None else incw)
+        return h.hexdigest()
+
+    def run(self, solver, bar, incw=None, **kwargs):
+        """Get results from cache, or compute (and store) them.
+
+        On a cache hit, the returned object holds a copy of the bar read from
+        the cache (:attr:`WP2.bar`), not **bar** itself.
+
+        :param class solver: :class:`WP2` or :class:`Waveprop`
+        :param obj bar: :class:`BarSet` or :class:`BarSingle`
+        :param array incw: incident wave
+        :param kwargs: other arguments given to **solver**
+        """
+        key = self.key(solver, bar, incw, **kwargs)
+        fname = os.path.join(self.path, key+'.npz')
+        if os.path.exists(fname):
+            try:
+                prop = load(fname, fmt='npz')
+            except (OSError, ValueError, KeyError):
+                # corrupted entry (eg. interrupted write): compute again
+                pass
+            else:
+                os.utime(fname)  # most recently used
+                self.hits += 1
+                return prop
+
+        self.misses += 1
+        prop = solver(bar, incw, **kwargs)
+        tmp = fname+'.tmp.npz'
+        save(prop, tmp, fmt='npz')
+        os.replace(tmp, fname)  # atomic, concurrent runs do not see partial files
+        self.evict()
+        return prop
+
+    def WP2(self, bar, incw=None, **kwargs):
+        """Cached :class:`WP2` computation, see :meth:`run`"""
+        return self.run(WP2, bar, incw, **kwargs)
+
+    def Waveprop(self, bar, incw, **kwargs):
+        """Cached :class:`Waveprop` computation, see :meth:`run`"""
+        return self.run(Waveprop, bar, incw, **kwargs)
+
+    def entries(self):
+        """List cache entries as (file name, size, last use time), most recent first"""
+        entries = []
+        for fname in os.listdir(self.path):
+            if fname.endswith('.npz') and not fname.endswith('.tmp.npz'):
+                full = os.path.join(self.path, fname)
+                try:
+                    st = os.stat(full)
+                except OSError:
+                    continue  # removed meanwhile
+                entries.append((full, st.st_size, st.st_mtime))
+        entries.sort(key=lambda ee: ee[2], reverse=True)
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in :attr:`maxsize`"""
+        entries = self.entries()
+        size = sum([ee[1] for ee in entries])
+        while entries and size>self.maxsize:
+            fname, fsize, _ = entries.pop()
+            try:
+                os.remove(fname)
+            except OSError:
+                # file in use (memory-mapped on Windows...)
+                continue
+            size -= fsize
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all the cache entries"""
+        for fname, _, _ in self.entries():
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+
+    @property
+    def stats(self):
+        """Cache statistics: hits, misses, evictions, number of entries and size [bytes]"""
+        entries = self.entries()
+        nreq = self.hits + self.misses
+        return {'hits':self.hits, 'misses':self.misses, 'evictions':self.evictions,
+                'hitrate':self.hits/nreq if nreq else 0.,
+                'entries':len(entries), 'size':sum([ee[1] for ee in entries]),
+                'maxsize':self.maxsize}
+
+    def __repr__(self):
+        return 'SimulationCache(%r, %s)'%(self.path, self.stats)
+
+
+def _hashArray(h, arr):
+    """Update hash with array content, shape and type.
+
+    :param obj h: :mod:`hashlib` hash object
+    :param array arr: array to hash
+    """
+    arr = np.ascontiguousarray(arr)
+    h.update(str((arr.shape, arr.dtype.str)).encode())
+    h.update(arr.tobytes())
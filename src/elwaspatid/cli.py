@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Command line interface: batch of simulations described by case files.
+
+Each case file (JSON, TOML or YAML) describes one computation. Several case
+files, or directories of case files, can be given; the cases are computed in
+parallel::
+
+    elwaspatid cases/ shot12.toml -o results -j 8
+
+Example of case file (JSON)::
+
+    {
+      "name": "grooved",
+      "solver": "WP2",
+      "bar": {"type": "BarSet", "E": [210e9, 210e9], "rho": [7800, 7800],
+              "L": [1, 0.5], "d": [0.030, 0.025], "nmin": 20,
+              "changeSection": [{"iseg": 1, "l": 0.2, "d": 0.02}]},
+      "incw": {"trapezeWave": {"plateau": 50, "rise": 10, "A": -1000}},
+      "nstep": 3000,
+      "right": "infinite",
+      "probes": [0.5, 1.2],
+      "diagrams": ["F", "V"]
+    }
+
+Keys of a case file:
+
+* **name**: name of the case (default: name of the file), results are written in this subdirectory of the output directory;
+* **solver**: 'WP2' (default) or 'Waveprop';
+* **bar**: bar definition, **type** is 'BarSet' (default, arguments of :class:`BarSet`, and lists of :meth:`BarSet.changeSection` and :meth:`BarSet.setViscoelastic` arguments, viscoelastic Segments being only computed by 'WP2'), 'BarSingle' or 'groovedBar' (arguments of :func:`groovedBar`);
+* **incw**: incident wave, a list of values, ``{"trapezeWave": {...}}`` (arguments of :func:`trapezeWave`), or ``{"file": ...}``: '.npy' file or text file (with **column**, **delimiter**, **skiprows**) sampled at the time step of the bar, or strain gauge recording if the sampling rate **fs** is given (see :mod:`measure`, other keys are given to :class:`measure.IncidentWave`);
+* **left**, **right**: boundary conditions, strings or boundary objects ``{"type": "Spring", "K": 1e8}`` (see :mod:`boundaries`);
+* **interface**: law of the interfaces of :class:`WP2`, ``{"type": "Bonded"}`` or ``{"type": "Contact", "threshold": 1e-6, "hold": true}``;
+* **nstep**, **Vinit**, **contactLoss**, **activity**...: other arguments of the solver;
+* **probes**: positions of the sensors, signals are written in 'probes.csv';
+* **diagrams**: Lagrangian diagrams to plot ('F', 'V', 'D'), saved as PNG files;
+* **save**: save the results (default: true, see :func:`storage.save`).
+
+TOML files need Python >= 3.11 (or the :mod:`tomli` package), YAML files need
+the :mod:`yaml` package.
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import multiprocessing as mp
+from time import perf_counter
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from .elwaspatid import WP2, Waveprop, BarSingle, BarSet, trapezeWave, groovedBar, Bonded, Contact
+from .storage import save
+from . import boundaries
+from .measure import GaugeRecord, IncidentWave
+
+
+#: extensions of the case files
+EXTENSIONS = ('.json', '.toml', '.yaml', '.yml')
+
+#: solvers available in the case files
+SOLVERS = {'WP2':WP2, 'Waveprop':Waveprop}
+
+#: interface laws available in the case files
+INTERFACES = {'Bonded':Bonded, 'Contact':Contact}
+
+#: keys of a case file which are not arguments of the solver
+CASEKEYS = ('name', 'solver', 'bar', 'incw', 'probes', 'diagrams', 'save', 'path')
+
+
+def readCase(path):
+    """Read a case file (JSON, TOML or YAML)
+
+    :param str path: name of the file
+    :returns: case (dict)
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext=='.json':
+        with open(path) as ff:
+            case = json.load(ff)
+    elif ext=='.toml':
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib  # Python < 3.11
+        with open(path, 'rb') as ff:
+            case = tomllib.load(ff)
+    elif ext in ('.yaml', '.yml'):
+        import yaml
+        with open(path) as ff:
+            case = {kk:(vv if kk=='name' else _numbers(vv)) for kk, vv in yaml.safe_load(ff).items()}
+    else:
+        raise ValueError("Unknown case file format: '%s'"%path)
+    case.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    case['path'] = path
+    return case
+
+
+def _numbers(obj):
+    """Convert the numbers read as strings by YAML (eg. 210e9) to floats"""
+    if isinstance(obj, dict):
+        return {kk:_numbers(vv) for kk, vv in obj.items()}
+    if isinstance(obj, list):
+        return [_numbers(vv) for vv in obj]
+    if isinstance(obj, str) and re.match(r'^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$', obj):
+        return float(obj)
+    return obj
+
+
+def findCases(paths):
+    """Case files given on the command line (directories are searched)
+
+    :param list paths: names of files or directories
+    :returns: list of file names
+    """
+    files = []
+    for pp in paths:
+        if os.path.isdir(pp):
+            files.extend(sorted([os.path.join(pp, ff) for ff in os.listdir(pp)
+                                 if ff.lower().endswith(EXTENSIONS)]))
+        else:
+            files.append(pp)
+    return files
+
+
+def buildBar(spec):
+    """Bar of a case
+
+    :param dict spec: bar definition (see module documentation)
+    """
+    spec = dict(spec)
+    typ = spec.pop('type', 'BarSet')
+    if typ=='BarSet':
+        changes = spec.pop('changeSection', [])
+        visco = spec.pop('setViscoelastic', [])
+        bar = BarSet(**spec)
+        for cs in changes:
+            bar.changeSection(**cs)
+        for vv in visco:
+            bar.setViscoelastic(**vv)
+    elif typ=='BarSingle':
+        spec['d'] = np.asarray(spec['d'], dtype=float)
+        bar = BarSingle(**spec)
+    elif typ=='groovedBar':
+        bar, _ = groovedBar(**spec)
+    else:
+        raise ValueError("Unknown bar type: '%s'"%typ)
+    return bar
+
+
+def buildIncw(spec, bar, basedir='.'):
+    """Incident wave of a case
+
+    :param obj spec: incident wave definition (see module documentation)
+    :param obj bar: bar of the case
+    :param str basedir: directory of the case file (for relative file names)
+    """
+    if spec is None:
+        return None
+    if isinstance(spec, dict):
+        spec = dict(spec)
+        if 'trapezeWave' in spec:
+            return trapezeWave(**spec['trapezeWave'])
+        path = os.path.join(basedir, spec.pop('file'))
+        if 'fs' in spec:
+            # gauge recording, resampled to the time step of the bar
+            rec = {kk:spec.pop(kk) for kk in ('fs', 'column', 'delimiter', 'skiprows',
+                                              'binary', 'dtype', 'ncol', 'gain') if kk in spec}
+            return IncidentWave(GaugeRecord(path, **rec), bar, **spec)
+        if path.endswith('.npy'):
+            return np.load(path)
+        return np.loadtxt(path, delimiter=spec.get('delimiter'), skiprows=spec.get('skiprows', 0),
+                          usecols=(spec.get('column', 0),), ndmin=1)
+    return np.asarray(spec, dtype=float)
+
+
+def buildBoundary(spec):
+    """Boundary condition of a case: string, or boundary object
+
+    :param obj spec: 'free', 'infinite'... or dict with the **type** of boundary object and its parameters
+    """
+    if isinstance(spec, dict):
+        spec = dict(spec)
+        cls = getattr(boundaries, spec.pop('type'))
+        return cls(**spec)
+    return spec
+
+
+def runCase(case, outdir, fmt='npz'):
+    """Compute a case and write its results.
+
+    :param dict case: case (see module documentation)
+    :param str outdir: output directory
+    :param str fmt: format of the saved results ('npz' or 'h5')
+    :returns: summary of the case (dict)
+    """
+    start = perf_counter()
+    basedir = os.path.dirname(case.get('path', ''))
+    bar = buildBar(case['bar'])
+    incw = buildIncw(case.get('incw'), bar, basedir)
+    kw = {kk:vv for kk, vv in case.items() if kk not in CASEKEYS}
+    for bc in ('left', 'right'):
+        if bc in kw:
+            kw[bc] = buildBoundary(kw[bc])
+    if isinstance(kw.get('interface'), dict):
+        spec = dict(kw['interface'])
+        kw['interface'] = INTERFACES[spec.pop('type')](**spec)
+    solver = case.get('solver', 'WP2')
+    prop = SOLVERS[solver](bar, incw, **kw)
+
+    dest = os.path.join(outdir, case['name'])
+    os.makedirs(dest, exist_ok=True)
+    files = []
+    probes = case.get('probes', [])
+    if probes:
+        cols = [prop.time]
+        head = ['time']
+        for xx in probes:
+            if solver=='WP2':
+                F, V, D, _ = prop.getSignal(xx, plot=False)
+            else:
+                _, F, V, D = prop.getcut(x=xx)
+            cols.extend([F, V, D])
+            head.extend(['F@%g'%xx, 'V@%g'%xx, 'D@%g'%xx])
+        files.append(os.path.join(dest, 'probes.csv'))
+        np.savetxt(files[-1], np.column_stack(cols), delimiter=',', header=','.join(head))
+    for typ in case.get('diagrams', []):
+        if solver=='WP2':
+            prop.plot(figname=typ, typ=typ)
+        else:
+            prop.plot(typ=typ)
+        for num in plt.get_fignums():
+            files.append(os.path.join(dest, 'diagram-%s-%i.png'%(typ, num)))
+            plt.figure(num).savefig(files[-1])
+        plt.close('all')
+    if case.get('save', True):
+        files.append(os.path.join(dest, 'result.%s'%fmt))
+        save(prop, files[-1], fmt=fmt)
+    summary = {'name':case['name'], 'path':case.get('path'), 'solver':solver,
+               'nT':len(prop.time), 'elapsed':perf_counter()-start, 'files':files}
+    with open(os.path.join(dest, 'summary.json'), 'w') as ff:
+        json.dump(summary, ff, indent=2)
+    return summary
+
+
+def _run(args):
+    """Run a case file, catching errors (for the pool of processes)"""
+    path, outdir, fmt = args
+    try:
+        return runCase(readCase(path), outdir, fmt)
+    except Exception as err:
+        return {'path':path, 'error':'%s: %s'%(type(err).__name__, err)}
+
+
+def main(argv=None):
+    """Entry point of the ``elwaspatid`` command.
+
+    :param list argv: command line arguments (default: :data:`sys.argv`)
+    :returns: exit status (1 if a case failed)
+    """
+    parser = argparse.ArgumentParser(prog='elwaspatid',
+                                     description="Batch of wave propagation computations described by case files (JSON, TOML or YAML).")
+    parser.add_argument('cases', nargs='+', help="case files or directories of case files")
+    parser.add_argument('-o', '--outdir', default='results', help="output directory (default: results)")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="number of parallel processes (0: number of CPUs)")
+    parser.add_argument('-f', '--format', default='npz', choices=('npz', 'h5'), help="format of the saved results")
+    args = parser.parse_args(argv)
+
+    plt.switch_backend('Agg')
+    files = findCases(args.cases)
+    jobs = [(ff, args.outdir, args.format) for ff in files]
+    nproc = args.jobs or os.cpu_count() or 1
+    if nproc>1 and len(jobs)>1:
+        with mp.Pool(min(nproc, len(jobs))) as pool:
+            results = list(pool.imap_unordered(_run, jobs))
+    else:
+        results = [_run(jj) for jj in jobs]
+
+    nfail = 0
+    for res in sorted(results, key=lambda rr:rr['path']):
+        if 'error' in res:
+            nfail += 1
+            print("FAILED %s (%s)"%(res['path'], res['error']))
+        else:
+            print("done   %s -> %s (%.3g s)"%(res['path'], res['name'], res['elapsed']))
+    print("%i case(s), %i failed"%(len(results), nfail))
+    return 1 if nfail else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Compressed storage of the space-time arrays of :class:`WP2` and
+:class:`Waveprop` results.
+
+Most of a Force or Velocity diagram is exactly zero (before the wavefront,
+after the pulse), or made of plateaus (trapezoidal incident waves). The
+arrays are stored as runs of identical values (run-length encoding of the
+row-major array, a run can span several rows), which is lossless. A
+tolerance **rtol** removes the rounding noise of the plateaus::
+
+    prop = WP2(bar, incw, nstep=20000)
+    ratios = compress(prop, rtol=1e-9)  # compression ratio of each array
+    F, V, D, _ = prop.getSignal(x=0.5)  # same as before compression
+    prop.plot()
+
+The compressed arrays (:class:`RunLengthArray`) support the slicing used by
+:meth:`WP2.getSignal`, :meth:`Waveprop.getcut` and the plotting methods: a
+column (signal at a node) costs one binary search per time step, a row (state
+of the bar) the decompression of the runs of the row.
+"""
+
+import numpy as np
+
+from .storage import FIELDS, SEGFIELDS
+
+
+class RunLengthArray(np.lib.mixins.NDArrayOperatorsMixin):
+    """Read-only 2D array (time versus space) stored as runs of identical
+    values.
+
+    Conversion to a :class:`numpy.ndarray` (eg. for plotting, or with
+    arithmetic operators) decompresses all the data.
+    """
+
+    def __init__(self, shape, starts, values, cols=None):
+        """
+
+        :param tuple shape: shape of the (whole) array
+        :param array starts: flat index of the beginning of each run
+        :param array values: value of each run
+        :param tuple cols: (start, stop) columns of the array to consider
+        """
+        if cols is None:
+            cols = (0, shape[1])
+        self.fullshape = tuple(shape)
+        self.starts = starts
+        self.values = values
+        self.cols = cols
+
+    @classmethod
+    def fromArray(cls, arr, tol=0., block=1024):
+        """Compress a 2D array.
+
+        With a tolerance, the values are first rounded to multiples of
+        **tol** (lossy compression, error at most tol/2), which removes the
+        rounding noise of the plateaus.
+
+        :param array arr: array to compress (time versus space)
+        :param float tol: absolute tolerance (0: lossless)
+        :param int block: number of rows processed at once
+        """
+        nT, nX = arr.shape
+        itype = np.int32 if nT*nX<2**31 else np.int64
+        starts = []
+        values = []
+        last = None
+        for i0 in range(0, nT, block):
+            flat = np.ascontiguousarray(arr[i0:i0+block]).ravel()
+            if tol>0:
+                flat = np.round(flat/tol)*tol
+            new = np.hstack((True if last is None else not flat[0]==last, flat[1:]!=flat[:-1]))
+            ind = np.flatnonzero(new)
+            starts.append((ind + i0*nX).astype(itype))
+            values.append(flat[ind])
+            if len(flat):
+                last = flat[-1]
+        starts = np.hstack([np.zeros(0, dtype=itype)] + starts)
+        values = np.hstack([np.zeros(0, dtype=arr.dtype)] + values)
+        return cls((nT, nX), starts, values)
+
+    def view(self, start, stop):
+        """Array restricted to some columns (no copy)
+
+        :param int start: first column
+        :param int stop: last column + 1
+        """
+        return RunLengthArray(self.fullshape, self.starts, self.values,
+                              cols=(self.cols[0]+start, self.cols[0]+stop))
+
+    @property
+    def shape(self):
+        return (self.fullshape[0], self.cols[1]-self.cols[0])
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    @property
+    def nbytes(self):
+        """Memory used by the runs (shared with the views) [bytes]"""
+        return self.starts.nbytes + self.values.nbytes
+
+    @property
+    def ratio(self):
+        """Compression ratio: size of the dense array over size of the runs"""
+        nT, nX = self.fullshape
+        return nT*nX*self.values.itemsize/max(self.nbytes, 1)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _flat(self, p0, p1):
+        """Decompress the flat indices [p0, p1) of the whole array"""
+        i0 = np.searchsorted(self.starts, p0, side='right') - 1
+        i1 = np.searchsorted(self.starts, p1, side='left')
+        bounds = np.clip(np.hstack((self.starts[i0:i1], p1)), p0, p1)
+        return np.repeat(self.values[i0:i1], np.diff(bounds))
+
+    def _rows(self, r0, r1):
+        """Decompress the (whole) rows [r0, r1)"""
+        nX = self.fullshape[1]
+        return self._flat(r0*nX, r1*nX).reshape(r1-r0, nX)
+
+    def __getitem__(self, key):
+        """Decompress the given slice."""
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        rows, cols = key
+        nT, nX = self.fullshape
+        cols = np.arange(*self.cols)[cols]
+        if isinstance(rows, slice) and rows.step in (None, 1):
+            r0, r1, _ = rows.indices(nT)
+            rr = np.arange(r0, max(r1, r0))
+        else:
+            rr = np.arange(nT)[rows]
+        if cols.ndim==0:
+            # signal at a node: one binary search per time step
+            ind = np.searchsorted(self.starts, rr*nX + cols, side='right') - 1
+            return self.values[ind]
+        if rr.ndim==0:
+            return self._rows(rr, rr+1)[0, cols]
+        if len(rr) and np.all(np.diff(rr)==1):
+            return self._rows(rr[0], rr[-1]+1)[:, cols]
+        return np.array([self._rows(ii, ii+1)[0, cols] for ii in rr]).reshape(len(rr), len(cols))
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self._rows(0, self.fullshape[0])[:, self.cols[0]:self.cols[1]]
+        if dtype is not None:
+            arr = arr.astype(dtype)
+        return arr
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = [np.asarray(ii) if isinstance(ii, RunLengthArray) else ii for ii in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def min(self):
+        """Minimum, without decompression"""
+        if self.cols==(0, self.fullshape[1]):
+            return self.values.min()
+        return np.asarray(self).min()
+
+    def max(self):
+        """Maximum, without decompression"""
+        if self.cols==(0, self.fullshape[1]):
+            return self.values.max()
+        return np.asarray(self).max()
+
+    def __repr__(self):
+        return 'RunLengthArray(shape=%s, dtype=%s, ratio=%.3g)'%(self.shape, self.dtype, self.ratio)
+
+
+def compress(prop, fields=None, rtol=0.):
+    """Replace the space-time arrays of :class:`WP2` or :class:`Waveprop`
+    results by :class:`RunLengthArray` (in place).
+
+    Arrays which do not compress (ratio below 1) are kept dense. For
+    :class:`WP2`, the arrays of the :class:`Segment` are views on the global
+    compressed arrays (Force, Veloc, Displ), Strain and Stress of each
+    Segment are compressed separately.
+
+    :param obj prop: :class:`WP2` or :class:`Waveprop` object
+    :param list fields: names of the arrays to compress (default: all, see :data:`storage.FIELDS`)
+    :param float rtol: tolerance, relative to the maximum absolute value of each array (0: lossless)
+    :returns: compression ratio of each array (dict)
+    """
+    typ = prop.__class__.__name__
+    if fields is None:
+        fields = FIELDS[typ]
+    ratios = {}
+    done = []  # compressed global arrays
+    for ff in fields:
+        arr = _compress(getattr(prop, ff), rtol)
+        ratios[ff] = arr.ratio
+        if arr.ratio>1:
+            setattr(prop, ff, arr)
+            done.append(ff)
+    if typ=='WP2':
+        if 'Force' in done:
+            prop._Force = prop.Force
+        for ii, ss in enumerate(prop.bar.seg):
+            cols = {'Force':(prop.indF[ii], prop.indF[ii]+ss.nX),
+                    'Veloc':(prop.indV[ii], prop.indV[ii+1]),
+                    'Displ':(prop.indV[ii], prop.indV[ii+1])}
+            for ff in done:
+                if ff in cols:
+                    setattr(ss, ff, getattr(prop, ff).view(*cols[ff]))
+            for ff in SEGFIELDS:
+                arr = getattr(ss, ff, None)
+                if arr is not None:
+                    arr = _compress(arr, rtol)
+                    ratios['seg/%i/%s'%(ii, ff)] = arr.ratio
+                    if arr.ratio>1:
+                        setattr(ss, ff, arr)
+    return ratios
+
+
+def _compress(arr, rtol=0.):
+    """:class:`RunLengthArray` of an array (unchanged if already compressed)
+
+    :param array arr: 2D array
+    :param float rtol: tolerance, relative to the maximum absolute value
+    """
+    if isinstance(arr, RunLengthArray):
+        return arr
+    arr = np.asarray(arr)
+    tol = rtol*np.abs(arr).max() if rtol>0 and arr.size else 0.
+    return RunLengthArray.fromArray(arr, tol=tol)
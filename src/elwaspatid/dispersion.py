@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Correction of the geometric dispersion of the 1D results.
+
+The 1D model propagates all frequencies at the bar celerity co, whereas in a
+real bar of diameter d the phase velocity decreases with frequency
+(Pochhammer-Chree equation, first longitudinal mode). Signals computed by
+:class:`WP2` or :class:`Waveprop` are moved between positions of a bar with
+the dispersive phase velocity (FFT, phase shift, inverse FFT)::
+
+    disp = Dispersion(nu=0.29, d=0.030, co=5000)
+    F, V, D, _ = test.getSignal(x=1.5, plot=False)
+    Fd = disp.propagate(F, test.bar.dt, dist=1.5)  # dispersion along 1.5 m
+
+With the default **only=True**, the 1D delay (dist/co) is already included in
+the signal and only the dispersion is added.
+
+The phase velocity of the first mode only depends on the Poisson ratio when
+expressed as c/co versus the radius over the wavelength: the dimensionless
+curve is computed once per Poisson ratio (:func:`dispersionTable`) and
+stored in a cache directory, all diameters and celerities then use the same
+table with linear interpolation.
+"""
+
+import os
+from functools import lru_cache
+
+import numpy as np
+
+
+#: change to invalidate the tables stored in the cache directories
+TABLE_VERSION = 1
+
+
+def _besselEven(z2, m=128):
+    """J0(z), z*J1(z) and J1(z)/z, which are even functions of z, for the
+    (real, possibly negative) values of z**2.
+
+    Trapezoidal rule on the integral representation of the Bessel functions
+    (exponential convergence), valid for imaginary arguments.
+
+    :param array z2: square of the argument
+    :param int m: number of integration points
+    """
+    z = np.sqrt(z2.astype(complex))[..., None]
+    tau = 2*np.pi*np.arange(m)/m
+    e = np.exp(1j*z*np.sin(tau))  # e^(iz sin(tau))
+    J0 = np.mean(e, axis=-1)
+    J1 = np.mean(e*np.exp(-1j*tau), axis=-1)
+    z = z[..., 0]
+    small = np.abs(z)<1e-8
+    J1z = np.where(small, 0.5, J1/np.where(small, 1, z))
+    return J0.real, (z*J1).real, J1z.real
+
+
+def frequencyEquation(ka, r, nu):
+    """Pochhammer-Chree frequency equation of the longitudinal modes of a
+    cylinder (divided by beta, even in alpha and beta: real for all phase
+    velocities).
+
+    :param array ka: wavenumber times radius
+    :param array r: phase velocity over bar celerity c/co
+    :param float nu: Poisson ratio
+    """
+    c1 = (1 - nu)/((1 + nu)*(1 - 2*nu))  # (dilatational celerity/co)**2
+    c2 = 1/(2*(1 + nu))  # (shear celerity/co)**2
+    k2 = ka**2
+    a2 = k2*(r**2/c1 - 1)  # (alpha*a)**2
+    b2 = k2*(r**2/c2 - 1)  # (beta*a)**2
+    J0a, aJ1a, _ = _besselEven(a2)
+    J0b, _, J1bb = _besselEven(b2)
+    return (2*(b2 + k2)*aJ1a*J1bb - (b2 - k2)**2*J0a*J1bb - 4*k2*aJ1a*J0b)
+
+
+def dispersionTable(nu, kamax=20., n=400, cachedir='~/.cache/elwaspatid'):
+    """Phase velocity of the first longitudinal mode of a cylinder, as a
+    function of the frequency, for a Poisson ratio.
+
+    The table is read from **cachedir** if it was already computed (and kept
+    in memory).
+
+    :param float nu: Poisson ratio
+    :param float kamax: maximum wavenumber times radius
+    :param int n: number of points of the table
+    :param str cachedir: cache directory (None: no disk cache)
+    :returns: fa/co (frequency times radius over bar celerity), c/co
+    """
+    return _table(round(float(nu), 6), float(kamax), int(n), cachedir)
+
+
+@lru_cache(maxsize=16)
+def _table(nu, kamax, n, cachedir):
+    """Table of :func:`dispersionTable`, kept in memory"""
+    path = None
+    if cachedir is not None:
+        cachedir = os.path.expanduser(cachedir)
+        path = os.path.join(cachedir, 'pochhammer-v%i-nu%.6f-ka%g-n%i.npz'
+                            %(TABLE_VERSION, nu, kamax, n))
+        if os.path.exists(path):
+            with np.load(path) as data:
+                return data['fa'], data['r']
+    ka = np.linspace(0, kamax, n)[1:]
+    # the first mode is the lowest root, between Rayleigh and bar celerity
+    rmin = 0.8*np.sqrt(1/(2*(1 + nu)))
+    rr = np.linspace(rmin, 1, 300)
+    f = frequencyEquation(ka[:, None], rr[None, :], nu)
+    change = np.signbit(f[:, 1:])!=np.signbit(f[:, :-1])
+    if not np.all(change.any(axis=1)):
+        raise ValueError("First mode not found for nu=%g"%nu)
+    ir = np.argmax(change, axis=1)
+    lo, hi = rr[ir], rr[ir+1]
+    flo = frequencyEquation(ka, lo, nu)
+    for _ in range(45):
+        mid = (lo + hi)/2
+        fm = frequencyEquation(ka, mid, nu)
+        same = np.signbit(fm)==np.signbit(flo)
+        lo = np.where(same, mid, lo)
+        flo = np.where(same, fm, flo)
+        hi = np.where(same, hi, mid)
+    r = np.hstack((1., (lo + hi)/2))
+    fa = np.hstack((0., ka))*r/(2*np.pi)  # f*a/co = (c/co)*ka/(2*pi)
+    if path is not None:
+        os.makedirs(cachedir, exist_ok=True)
+        np.savez(path, fa=fa, r=r, nu=nu)
+    return fa, r
+
+
+class Dispersion:
+    """Dispersive propagation of signals in a bar (first longitudinal
+    Pochhammer-Chree mode).
+    """
+
+    def __init__(self, nu, d, co, cachedir='~/.cache/elwaspatid', **kw):
+        """
+
+        :param float nu: Poisson ratio
+        :param float d: diameter of the bar
+        :param float co: bar celerity sqrt(E/rho)
+        :param str cachedir: cache directory of the tables (None: no disk cache)
+        :param kw: other arguments of :func:`dispersionTable`
+        """
+        self.nu = nu
+        self.d = d
+        self.co = co
+        self.fa, self.r = dispersionTable(nu, cachedir=cachedir, **kw)
+
+    @classmethod
+    def fromSegment(cls, seg, nu, **kw):
+        """Dispersion in a :class:`Segment` (of constant section)
+
+        :param obj seg: :class:`Segment` of a :class:`BarSet` (or :class:`BarSingle`)
+        :param float nu: Poisson ratio
+        :param kw: other arguments of :class:`Dispersion`
+        """
+        co = seg.dx/seg.dt
+        A = np.mean(seg.Z)*co/seg.E  # Z = A*E/co
+        return cls(nu, np.sqrt(4*A/np.pi), co, **kw)
+
+    def velocity(self, f):
+        """Phase velocity
+
+        :param array f: frequency [Hz]
+        :returns: phase velocity [m/s] (last value of the table beyond, close to the Rayleigh celerity)
+        """
+        return np.interp(np.abs(f)*self.d/2/self.co, self.fa, self.r)*self.co
+
+    def propagate(self, sig, dt, dist, only=True):
+        """Propagate signals along a distance of the bar.
+
+        :param array sig: signals (..., nT), time is the last axis
+        :param float dt: time step
+        :param float dist: distance [m] (negative: back to the source)
+        :param bool only: only add the dispersion (the delay dist/co is already in the signal, as for 1D results)
+        :returns: signals, same shape
+        """
+        sig = np.asarray(sig, dtype=float)
+        nT = sig.shape[-1]
+        delay = 0 if only else abs(dist)/self.co
+        nfft = 2**int(np.ceil(np.log2(2*nT + delay/dt)))
+        f = np.fft.rfftfreq(nfft, dt)
+        slow = 1/self.velocity(f) - (1/self.co if only else 0)
+        H = np.exp(-2j*np.pi*f*dist*slow)
+        return np.fft.irfft(np.fft.rfft(sig, n=nfft, axis=-1)*H, n=nfft, axis=-1)[..., :nT]
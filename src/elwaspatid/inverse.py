@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Identification of the impedance profile of a bar from a reflection record.
+
+The elements of the discretized bar all have the same travel time (one time
+step), which is a Goupillaud layered medium: the impedances are recovered
+one element after the other by layer-peeling (downward continuation of the
+force and velocity from the impacted end), in O(N²) operations::
+
+    bar = layerPeeling(incw, refl, dt, E=210e9, rho=7800, Zin=Zbar)
+    prop = Waveprop(bar, incw)  # forward computation with the identified bar
+    bar.plot()  # locate grooves or defects
+
+The incident and reflected waves are the waves in a semi-infinite input bar
+of impedance **Zin**, impacting the bar at its left end. They must be sampled
+with the same time step, at the impacted end, and **incw[i]** and **refl[i]**
+must be the waves at the same instant. With the convention of :class:`WP2`
+and :class:`Waveprop`, **incw[i]** enters the bar at time (i+1)*dt, so that
+the reflected wave of a computation is::
+
+    prop = Waveprop(bar, incw, nstep=len(incw)+1, left='infinite')
+    refl = prop.Force[1:, 0] - incw  # force at (i+1)*dt minus incw[i]
+
+A shift of one sample between **incw** and **refl** gives a wrong profile.
+"""
+
+import warnings
+
+import numpy as np
+
+from .elwaspatid import BarSingle
+
+
+def layerPeeling(incw, refl, dt, E, rho, Zin, nelt=None, tol=1e-6):
+    """Identify the impedance of the elements of a bar by layer-peeling.
+
+    At the arrival of the wavefront at a node, nothing comes back from the
+    unknown part of the bar: the leftgoing invariant F+ZV is null, which gives
+    the impedance Z of the next element. Force and velocity are then
+    continued through this element to the next node with the characteristic
+    relations of :class:`Waveprop`.
+
+    :param array incw: incident force wave at the impacted end
+    :param array refl: reflected force wave at the impacted end, at the same instants as **incw** (refl[i] at time (i+1)*dt for **incw** given to :class:`Waveprop`, see module documentation)
+    :param float dt: time step of **incw** and **refl**
+    :param float E: Young's modulus of the bar
+    :param float rho: density of the bar
+    :param float Zin: impedance of the input bar
+    :param int nelt: number of elements to identify (as many as possible if None)
+    :param float tol: relative threshold for the beginning of the incident wave
+    :returns: identified bar (:class:`BarSingle`)
+    """
+    incw = np.asarray(incw, dtype=float)
+    refl = np.asarray(refl, dtype=float)
+    nT = min(len(incw), len(refl))
+    # force and velocity at the impacted end (node 0)
+    F = incw[:nT] + refl[:nT]
+    V = (refl[:nT] - incw[:nT])/Zin
+    # wavefront reaches node i at time t0+i
+    t0 = np.nonzero(np.abs(incw[:nT])>tol*np.abs(incw[:nT]).max())[0][0]
+    # node i is known up to time nT-1-i, two time steps are needed at the wavefront
+    nmax = (nT - 2 - t0)//2 + 1
+    if nelt is None:
+        nelt = nmax
+    elif nelt>nmax:
+        raise ValueError("Record too short to identify %i elements (%i at most)"%(nelt, nmax))
+
+    Z = np.zeros(nelt)
+    for ii in range(nelt):
+        # null leftgoing invariant at the wavefront (least squares on 2 time steps)
+        Ff = F[t0+ii:t0+ii+2]
+        Vf = V[t0+ii:t0+ii+2]
+        Zi = -np.dot(Ff, Vf)/np.dot(Vf, Vf)
+        if not Zi>tol*Zin:
+            # free end reached, or noise
+            warnings.warn("Null or negative impedance identified for element %i, stopping"%ii)
+            Z = Z[:ii]
+            break
+        Z[ii] = Zi
+        # continuation to next node: rightgoing invariant from time t-1,
+        # leftgoing invariant from time t+1
+        R = F[:-2] - Zi*V[:-2]
+        L = F[2:] + Zi*V[2:]
+        F = np.zeros(nT)
+        V = np.zeros(nT)
+        F[1:-1] = (R + L)/2
+        V[1:-1] = (L - R)/(2*Zi)
+
+    # back to diameters of a BarSingle
+    co = np.sqrt(E/rho)
+    A = Z/(rho*co)
+    return BarSingle(co*dt, np.sqrt(4*A/np.pi), E, rho)
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Measured incident waves: strain gauge recordings used as input of the solvers.
+
+The recordings are sampled at the rate of the acquisition system, whereas the
+incident wave **incw** of the solvers must be sampled at the time step of the
+bar. The recording is read from disk by chunks, converted from strain to
+force (:math:`F=EA\\varepsilon`, with the properties of the first element of
+the bar), and resampled with a polyphase filter::
+
+    rec = GaugeRecord('shot12.csv', fs=2e6, column=1, skiprows=1)
+    incw = IncidentWave(rec, bar, start=0.0012, duration=300e-6)
+    prop = WP2(bar, incw, nstep=5000)
+
+:class:`IncidentWave` behaves as a sequence which is read sequentially by
+the solvers: only a few chunks of the recording are in memory at a time. Use
+:meth:`IncidentWave.toArray` to get the whole resampled wave.
+
+The ratio between the time step and the sampling period is approximated by
+a fraction (see **maxden**), the error on the time base is printed.
+"""
+
+import itertools
+from fractions import Fraction
+
+import numpy as np
+
+
+class GaugeRecord:
+    """Strain gauge recording stored in a CSV (text) or raw binary file."""
+
+    def __init__(self, filename, fs, column=0, delimiter=',', skiprows=0,
+                 binary=None, dtype='<f8', ncol=1, gain=1.):
+        """
+
+        :param str filename: name of the file
+        :param float fs: sampling rate of the recording [Hz]
+        :param int column: index of the column of the strain signal
+        :param str delimiter: delimiter of the columns (CSV files)
+        :param int skiprows: number of header lines (CSV files)
+        :param bool binary: raw binary file (default: guessed from extension, '.bin', '.dat' or '.raw')
+        :param str dtype: data type of the binary file
+        :param int ncol: number of interleaved channels of the binary file
+        :param float gain: factor from the recorded values to strain
+        """
+        if binary is None:
+            binary = filename.lower().endswith(('.bin', '.dat', '.raw'))
+        self.filename = filename
+        self.fs = fs
+        self.column = column
+        self.delimiter = delimiter
+        self.skiprows = skiprows
+        self.binary = binary
+        self.dtype = np.dtype(dtype)
+        self.ncol = ncol
+        self.gain = gain
+        self._len = None
+
+    def __len__(self):
+        """Number of samples (one pass through the file for CSV files)"""
+        if self._len is None:
+            if self.binary:
+                self._len = self._memmap().shape[0]
+            else:
+                with open(self.filename) as ff:
+                    ll = itertools.islice(ff, self.skiprows, None)
+                    self._len = sum([1 for line in ll if line.strip()])
+        return self._len
+
+    def _memmap(self):
+        """Memory-map of the binary file, shape (nsample, ncol)"""
+        data = np.memmap(self.filename, dtype=self.dtype, mode='r')
+        return data[:len(data)//self.ncol*self.ncol].reshape(-1, self.ncol)
+
+    def chunks(self, size=2**16, start=0):
+        """Read the strain signal by chunks.
+
+        :param int size: number of samples of the chunks
+        :param int start: index of the first sample to read
+        :returns: generator of arrays of strain
+        """
+        if self.binary:
+            data = self._memmap()
+            for ii in range(start, data.shape[0], size):
+                yield self.gain*np.array(data[ii:ii+size, self.column], dtype=float)
+        else:
+            with open(self.filename) as ff:
+                lines = (ll for ll in itertools.islice(ff, self.skiprows, None) if ll.strip())
+                lines = itertools.islice(lines, start, None)
+                while True:
+                    block = list(itertools.islice(lines, size))
+                    if not block:
+                        break
+                    yield self.gain*np.loadtxt(block, delimiter=self.delimiter,
+                                               usecols=(self.column,), ndmin=1)
+
+
+class Resampler:
+    """Streaming polyphase resampler: rate multiplied by **up**/**down**.
+
+    Kaiser-windowed sinc low-pass filter, as :func:`scipy.signal.resample_poly`.
+    The delay of the filter is compensated: output sample n is at the time of
+    input sample n*down/up.
+    """
+
+    def __init__(self, up, down, halfwidth=10, beta=5.):
+        """
+
+        :param int up: upsampling factor
+        :param int down: downsampling factor
+        :param int halfwidth: half-length of the filter, in samples of the lowest rate
+        :param float beta: parameter of the Kaiser window
+        """
+        gg = np.gcd(up, down)
+        up, down = up//gg, down//gg
+        half = halfwidth*max(up, down)  # in upsampled samples
+        nn = np.arange(-half, half+1)
+        fc = 1/max(up, down)  # cut-off frequency, relative to upsampled Nyquist
+        h = np.sinc(fc*nn)*np.kaiser(2*half+1, beta)
+        h *= up/h.sum()  # unit gain at null frequency
+        # polyphase table: H[p, q] = h[p+q*up]
+        ntap = -(-len(h)//up)
+        H = np.zeros(ntap*up)
+        H[:len(h)] = h
+        self.up = up
+        self.down = down
+        self.half = half
+        self.H = H.reshape(ntap, up).T
+        self.ntap = ntap
+        self.reset()
+
+    def reset(self):
+        """Forget the samples already processed"""
+        self._buf = np.zeros(self.ntap)  # input samples, the first at index _k0
+        self._k0 = -self.ntap
+        self._n = 0  # index of next output sample
+        self._nin = 0  # number of input samples received
+
+    def _kmax(self, n):
+        """Index of the last input sample involved in output samples **n**"""
+        return (n*self.down + self.half)//self.up
+
+    def process(self, x, last=False):
+        """Resample the next chunk of the input signal.
+
+        :param array x: next input samples
+        :param bool last: end of the input signal (zeros after)
+        :returns: new output samples
+        """
+        x = np.asarray(x, dtype=float)
+        self._nin += len(x)
+        buf = np.hstack((self._buf, x))
+        if last:
+            # output samples up to the time of the last input sample
+            nend = -(-self._nin*self.up//self.down)
+            buf = np.hstack((buf, np.zeros(max(self._kmax(nend-1) - self._k0 - len(buf) + 1, 0))))
+        else:
+            # output samples whose input samples are all available
+            nend = ((self._k0 + len(buf))*self.up - self.half - 1)//self.down + 1
+        n = np.arange(self._n, max(nend, self._n))
+        jj = n*self.down + self.half
+        kmax = jj//self.up
+        phase = jj - kmax*self.up
+        ind = kmax[:, None] - np.arange(self.ntap)[None, :] - self._k0
+        y = np.einsum('nq,nq->n', buf[ind], self.H[phase])
+        # keep the input samples needed by the next output samples
+        self._n = n[-1] + 1 if len(n) else self._n
+        keep = self._kmax(self._n) - self.ntap + 1 - self._k0
+        keep = min(max(keep, 0), len(buf))
+        self._buf = buf[keep:]
+        self._k0 += keep
+        return y
+
+
+class IncidentWave:
+    """Incident force wave from a strain gauge recording, resampled to the
+    time step of the bar.
+
+    Sequence of floats (length and indexing), read sequentially by chunks: it
+    can be given as **incw** to :class:`WP2` and :class:`Waveprop`. Random
+    access is possible but slow (the file is read again from the beginning
+    for indices before the current chunk).
+    """
+
+    def __init__(self, record, bar=None, start=0., duration=None, E=None, A=None,
+                 dt=None, chunk=2**16, maxden=1000, **kw):
+        """
+
+        :param obj record: :class:`GaugeRecord` instance
+        :param obj bar: bar setup (:class:`BarSet` or :class:`BarSingle`), gives E, A and dt
+        :param float start: time of the beginning of the incident wave in the recording [s]
+        :param float duration: duration of the incident wave [s] (default: until the end of the recording)
+        :param float E: Young's modulus of the gauged bar (supersedes **bar**)
+        :param float A: cross-section of the gauged bar (supersedes **bar**)
+        :param float dt: time step of the solver (supersedes **bar**)
+        :param int chunk: number of samples of the chunks read in the file
+        :param int maxden: maximum denominator of the ratio of time steps
+        :param kw: parameters of the :class:`Resampler`
+        """
+        if E is None:
+            E = np.atleast_1d(bar.E)[0]
+        if A is None:
+            A = np.pi*np.atleast_1d(bar.d)[0]**2/4
+        if dt is None:
+            dt = bar.dt
+        ratio = Fraction(dt*record.fs).limit_denominator(maxden)  # down/up
+        if ratio==0:
+            raise ValueError("Time step too small compared to sampling period")
+        err = float(ratio)/(dt*record.fs) - 1
+        if not err==0:
+            print("Time base of the resampled wave: relative error %.2g"%err)
+        self.record = record
+        self.E = E
+        self.A = A
+        self.dt = dt
+        self.chunk = chunk
+        self.up = ratio.denominator
+        self.down = ratio.numerator
+        self.istart = int(round(start*record.fs))  # first sample in record
+        nin = len(record) - self.istart
+        if duration is not None:
+            nin = min(nin, int(round(duration*record.fs)))
+        self.nin = nin
+        self._len = -(-nin*self.up//self.down)
+        self._kw = kw
+        self._rewind()
+
+    def __len__(self):
+        return self._len
+
+    def _rewind(self):
+        """Restart reading the record from the beginning"""
+        self._resampler = Resampler(self.up, self.down, **self._kw)
+        self._reader = self.record.chunks(self.chunk, start=self.istart)
+        self._nread = 0
+        self._out = np.zeros(0)  # current chunk of output samples
+        self._i0 = 0  # index of first sample of current chunk
+
+    def _next(self):
+        """Read and resample the next chunk of the record"""
+        x = next(self._reader, np.zeros(0))[:self.nin-self._nread]
+        self._nread += len(x)
+        last = self._nread>=self.nin
+        self._i0 += len(self._out)
+        self._out = self.E*self.A*self._resampler.process(x, last=last)
+
+    def __getitem__(self, ii):
+        if isinstance(ii, slice):
+            return np.array([self[jj] for jj in range(*ii.indices(self._len))])
+        if ii<0:
+            ii += self._len
+        if not 0<=ii<self._len:
+            raise IndexError("IncidentWave index out of range")
+        if ii<self._i0:
+            self._rewind()
+        while ii>=self._i0 + len(self._out):
+            self._next()
+        return self._out[ii-self._i0]
+
+    def __array__(self, dtype=None, copy=None):
+        return self.toArray() if dtype is None else self.toArray().astype(dtype)
+
+    def iterChunks(self):
+        """Resampled force wave, by chunks
+
+        :returns: generator of arrays of force
+        """
+        self._rewind()
+        n = 0
+        while n<self._len:
+            self._next()
+            out = self._out[:self._len-self._i0]
+            n += len(out)
+            if len(out):
+                yield out
+
+    def toArray(self):
+        """Whole resampled force wave (array)"""
+        return np.hstack([np.zeros(0)] + list(self.iterChunks()))
+
+    @property
+    def time(self):
+        """Time of the samples of the resampled wave, from **start** [s]"""
+        return np.arange(self._len)*self.dt
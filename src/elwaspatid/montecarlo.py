@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo propagation of the uncertainties on the bars (E, rho, d, L) to
+the signals of virtual gauges.
+
+The parameters of the :class:`BarSet` are sampled around their nominal
+values, the realizations are computed (in parallel) and the probe signals are
+aggregated online: running mean and variance (Welford algorithm) and
+streaming quantiles (P² algorithm). No realization is kept in memory, and
+the arrays of the solver are reused from one realization to the next (a
+:class:`Workspace` per process)::
+
+    mc = MonteCarlo(E=[E, E], rho=[rho, rho], L=[1, 1], d=[0.03, 0.03],
+                    scatter={'E':0.02, 'd':0.005}, incw=incw, probes=[0.5, 1.5],
+                    tmax=1e-3)
+    mc.run(1000, nproc=8)
+    mc.plot('Force', iprobe=1)  # mean and 5-95 % band
+    mc.stats['Force'].std  # shape (nT, nprobe)
+
+The time step of a realization depends on the sampled wave speeds: the
+signals are interpolated on the time base of the nominal bar (:attr:`time`).
+The incident wave is sampled with the nominal time step (or **dtinc**), and
+is interpolated on the time step of each realization.
+"""
+
+import os
+import copy
+import threading
+import multiprocessing as mp
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from .elwaspatid import WP2, Waveprop, BarSet, Workspace
+
+
+#: workspace of the realizations computed by each thread (see :func:`_workspace`)
+_local = threading.local()
+
+
+class Welford:
+    """Running mean and variance of arrays (Welford algorithm).
+
+    Two instances (eg. computed by different processes) can be merged with
+    :meth:`merge`.
+    """
+
+    def __init__(self, shape):
+        """
+
+        :param tuple shape: shape of the observed arrays
+        """
+        self.n = 0
+        self.mean = np.zeros(shape)
+        self.M2 = np.zeros(shape)  # sum of squared deviations
+
+    def add(self, x):
+        """Add an observation
+
+        :param array x: observation
+        """
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta/self.n
+        self.M2 += delta*(x - self.mean)
+
+    def merge(self, other):
+        """Add the observations summarized by another instance
+
+        :param obj other: :class:`Welford` instance
+        """
+        n = self.n + other.n
+        if n==0:
+            return
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta*other.n/n
+        self.M2 = self.M2 + other.M2 + delta**2*self.n*other.n/n
+        self.n = n
+
+    @property
+    def var(self):
+        """Unbiased variance"""
+        if self.n<2:
+            return np.full(self.mean.shape, np.nan)
+        return self.M2/(self.n - 1)
+
+    @property
+    def std(self):
+        """Unbiased standard deviation"""
+        return np.sqrt(self.var)
+
+
+class P2Quantile:
+    """Streaming estimate of a quantile of arrays, elementwise (P² algorithm
+    of Jain and Chlamtac, 1985): 5 markers per element, O(1) per observation.
+    """
+
+    def __init__(self, p, shape):
+        """
+
+        :param float p: quantile (between 0 and 1)
+        :param tuple shape: shape of the observed arrays
+        """
+        self.p = p
+        self.n = 0
+        self.q = np.zeros((5,) + tuple(shape))  # heights of the markers
+        self.pos = np.tile(np.arange(5.).reshape((5,) + (1,)*len(shape)), (1,) + tuple(shape))
+        self.want = np.array([0, 2*p, 4*p, 2 + 2*p, 4])  # desired positions
+        self.dwant = np.array([0, p/2, p, (1 + p)/2, 1])
+
+    def add(self, x):
+        """Add an observation
+
+        :param array x: observation
+        """
+        if self.n<5:
+            self.q[self.n] = x
+            self.n += 1
+            if self.n==5:
+                self.q.sort(axis=0)
+            return
+        self.n += 1
+        q, pos = self.q, self.pos
+        q[0] = np.minimum(q[0], x)
+        q[4] = np.maximum(q[4], x)
+        # markers above the observation are shifted
+        pos[1:] += x<q[1:]
+        pos[4] = self.n - 1  # last marker always on the maximum
+        self.want += self.dwant
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for ii in (1, 2, 3):
+                d = self.want[ii] - pos[ii]
+                move = ((d>=1) & (pos[ii+1]-pos[ii]>1)) | ((d<=-1) & (pos[ii-1]-pos[ii]<-1))
+                if not move.any():
+                    continue
+                ds = np.sign(d)
+                # parabolic prediction
+                qp = q[ii] + ds/(pos[ii+1] - pos[ii-1])*(
+                    (pos[ii] - pos[ii-1] + ds)*(q[ii+1] - q[ii])/(pos[ii+1] - pos[ii]) +
+                    (pos[ii+1] - pos[ii] - ds)*(q[ii] - q[ii-1])/(pos[ii] - pos[ii-1]))
+                # linear prediction, if the parabola is not monotonous
+                qn = np.where(ds>0, q[ii+1], q[ii-1])
+                pn = np.where(ds>0, pos[ii+1], pos[ii-1])
+                ql = q[ii] + ds*(qn - q[ii])/(pn - pos[ii])
+                qnew = np.where((q[ii-1]<qp) & (qp<q[ii+1]), qp, ql)
+                q[ii] = np.where(move, qnew, q[ii])
+                pos[ii] = np.where(move, pos[ii] + ds, pos[ii])
+
+    @property
+    def value(self):
+        """Current estimate of the quantile"""
+        if self.n<5:
+            # exact quantile of the first observations
+            return np.quantile(self.q[:max(self.n, 1)], self.p, axis=0)
+        return self.q[2].copy()
+
+
+class SignalStats:
+    """Online statistics of the signals of the probes: :class:`Welford` mean
+    and variance, :class:`P2Quantile` quantiles.
+    """
+
+    def __init__(self, shape, quantiles=(0.05, 0.5, 0.95)):
+        """
+
+        :param tuple shape: shape of the signals (nT, nprobe)
+        :param list quantiles: quantiles to estimate
+        """
+        self.welford = Welford(shape)
+        self.quantiles = {pp:P2Quantile(pp, shape) for pp in quantiles}
+
+    def add(self, x):
+        """Add the signals of a realization
+
+        :param array x: signals, shape (nT, nprobe)
+        """
+        self.welford.add(x)
+        for qq in self.quantiles.values():
+            qq.add(x)
+
+    @property
+    def n(self):
+        return self.welford.n
+
+    @property
+    def mean(self):
+        return self.welford.mean
+
+    @property
+    def std(self):
+        return self.welford.std
+
+    def quantile(self, p):
+        """Estimate of quantile **p** (one of the quantiles given at creation)"""
+        return self.quantiles[p].value
+
+
+class MonteCarlo:
+    """Monte Carlo computations of :class:`WP2` (or :class:`Waveprop`) with
+    scattered bar parameters.
+    """
+
+    def __init__(self, E, rho, L, d, incw=None, probes=(0,), scatter=None, tmax=None,
+                 nmin=4, dtinc=None, solver='WP2', fields=('Force',),
+                 quantiles=(0.05, 0.5, 0.95), seed=None, **kw):
+        """
+
+        :param list E: nominal Young's moduli of the segments
+        :param list rho: nominal densities
+        :param list L: nominal lengths
+        :param list d: nominal diameters
+        :param array incw: incident wave
+        :param list probes: positions of the virtual gauges (global coordinates)
+        :param dict scatter: relative standard deviation of the parameters (keys 'E', 'rho', 'L', 'd'), normal distributions, independent for each segment
+        :param float tmax: duration of the computations (default: 2.5 travels of the nominal bar)
+        :param int nmin: see :class:`BarSet`
+        :param float dtinc: time step of **incw** (default: time step of the nominal bar)
+        :param str solver: 'WP2' or 'Waveprop'
+        :param list fields: signals to aggregate ('Force', 'Veloc', 'Displ')
+        :param list quantiles: quantiles to estimate
+        :param int seed: seed of the random generator
+        :param kw: other arguments of the solver (boundary conditions...)
+        """
+        self.nominal = {'E':np.asarray(E, dtype=float), 'rho':np.asarray(rho, dtype=float),
+                        'L':np.asarray(L, dtype=float), 'd':np.asarray(d, dtype=float)}
+        self.scatter = dict(scatter or {})
+        bar = BarSet(E, rho, L, d, nmin=nmin)
+        if tmax is None:
+            tmax = 2.5*np.sum(self.nominal['L']/bar.bar_continuous.co)
+        self.time = np.arange(0, tmax, bar.dt)
+        self.incw = None if incw is None else np.asarray(incw, dtype=float)
+        self.dtinc = bar.dt if dtinc is None else dtinc
+        self.probes = np.atleast_1d(probes).astype(float)
+        self.nmin = nmin
+        self.solver = solver
+        self.fields = tuple(fields)
+        self.kw = kw
+        self.seed = np.random.SeedSequence(seed)
+        shape = (len(self.time), len(self.probes))
+        self.stats = {ff:SignalStats(shape, quantiles) for ff in self.fields}
+
+    @property
+    def n(self):
+        """Number of realizations"""
+        return self.stats[self.fields[0]].n
+
+    def sample(self, rng):
+        """Parameters of a realization
+
+        :param obj rng: :class:`numpy.random.Generator`
+        :returns: E, rho, L, d (dict)
+        """
+        par = {}
+        for kk, vv in self.nominal.items():
+            cv = self.scatter.get(kk, 0.)
+            par[kk] = vv*(1 + cv*rng.standard_normal(len(vv))) if cv else vv.copy()
+        return par
+
+    def run(self, n, nproc=1, chunksize=4):
+        """Compute **n** more realizations and add them to the statistics.
+
+        :param int n: number of realizations
+        :param int nproc: number of processes (0: number of CPUs)
+        :param int chunksize: number of realizations sent at once to a process
+        """
+        seeds = self.seed.spawn(n)
+        light = copy.copy(self)  # sent to the processes, without the statistics
+        light.stats = None
+        tasks = [(light, ss) for ss in seeds]
+        nproc = nproc or os.cpu_count() or 1
+        if nproc>1:
+            with mp.Pool(nproc) as pool:
+                for sig in pool.imap_unordered(_realization, tasks, chunksize=chunksize):
+                    self._add(sig)
+        else:
+            for tt in tasks:
+                self._add(_realization(tt))
+
+    def _add(self, signals):
+        """Add the signals of a realization to the statistics"""
+        for ff, sig in signals.items():
+            self.stats[ff].add(sig)
+
+    def compute(self, par):
+        """Compute a realization and interpolate its signals on :attr:`time`
+
+        :param dict par: E, rho, L, d of the bars
+        :returns: signals of each field, shape (nT, nprobe) (dict)
+        """
+        bar = BarSet(par['E'], par['rho'], par['L'], par['d'], nmin=self.nmin)
+        dt = bar.dt
+        nstep = int(np.ceil(self.time[-1]/dt)) + 2
+        incw = self.incw
+        if incw is not None and not dt==self.dtinc:
+            tinc = np.arange(len(incw))*self.dtinc
+            incw = np.interp(np.arange(0, tinc[-1], dt), tinc, incw)
+        # the signals are interpolated before the next realization: the arrays
+        # of the solver are reused
+        kw = dict(self.kw)
+        kw.setdefault('workspace', _workspace())
+        if self.solver=='WP2':
+            prop = WP2(bar, incw, nstep=nstep, **kw)
+        else:
+            prop = Waveprop(bar, incw, nstep=nstep, **kw)
+        # probes at the same relative position in their segment
+        xo = np.hstack((0, np.cumsum(self.nominal['L'])))
+        iseg = np.clip(np.searchsorted(xo, self.probes, side='right') - 1, 0, len(xo)-2)
+        xn = np.hstack((0, np.cumsum(par['L'])))
+        xx = xn[iseg] + (self.probes - xo[iseg])*par['L'][iseg]/self.nominal['L'][iseg]
+        signals = {}
+        for ff in self.fields:
+            sig = np.zeros((len(self.time), len(self.probes)))
+            for jj, (x, ii) in enumerate(zip(xx, iseg)):
+                if self.solver=='WP2':
+                    seg = prop.bar.seg[ii]
+                    col = getattr(seg, ff)[:, np.where(x>=seg.x)[0][-1]]
+                else:
+                    col = getattr(prop, ff)[:, np.where(x>=np.asarray(bar.x))[0][-1]]
+                sig[:, jj] = np.interp(self.time, prop.time, col)
+            signals[ff] = sig
+        return signals
+
+    def plot(self, field='Force', iprobe=0, figname=None, band=None):
+        """Plot mean signal and quantile band of a probe
+
+        :param str field: 'Force', 'Veloc' or 'Displ'
+        :param int iprobe: index of the probe
+        :param str figname: name for the figure
+        :param tuple band: lower and upper quantiles (default: extreme quantiles)
+        """
+        st = self.stats[field]
+        if band is None:
+            band = (min(st.quantiles), max(st.quantiles))
+        plt.figure(figname)
+        plt.fill_between(self.time*1e3, st.quantile(band[0])[:, iprobe],
+                         st.quantile(band[1])[:, iprobe], color='0.8',
+                         label='%g-%g %%'%(100*band[0], 100*band[1]))
+        plt.plot(self.time*1e3, st.mean[:, iprobe], 'k', label='mean')
+        plt.xlabel('t [ms]')
+        plt.ylabel(field)
+        plt.title('x = %g m, %i realizations'%(self.probes[iprobe], st.n))
+        plt.legend()
+        plt.box(False)
+
+
+def _workspace():
+    """:class:`Workspace` of the current thread (process of the pool)"""
+    if not hasattr(_local, 'workspace'):
+        _local.workspace = Workspace()
+    return _local.workspace
+
+
+def _realization(args):
+    """Sample and compute one realization (for the pool of processes)"""
+    mc, seed = args
+    return mc.compute(mc.sample(np.random.default_rng(seed)))
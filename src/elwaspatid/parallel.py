@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Domain decomposition of :class:`Waveprop` computations across processes.
+
+The scheme is explicit, and each node only depends on its two neighbours at
+the previous time step. A very long bar is split into contiguous chunks of
+nodes, one per worker process. Each worker steps its chunk plus a halo of
+**sync** nodes on each side, the halos being exchanged through shared memory
+every **sync** time steps::
+
+    bar = BarSingle(0.001, np.ones(2000000)*0.02, E, rho)
+    prop = ParallelWaveprop(bar, incw, nstep=5000, nproc=8, sync=16,
+                            nodes=[0, 500000, 1000000])  # only store 3 gauges
+    prop.Force  # shape (5000, 3)
+
+The results are identical to :class:`Waveprop`: the nodes are computed by
+the kernels of :class:`Segment` (:func:`middleState`, :func:`leftState`,
+:func:`rightState`). Traction crosses the interfaces, as in :class:`Waveprop`.
+The workers step their chunks themselves, not through :class:`Propagator`:
+the ``activity`` tracking (:class:`ActiveSpan`), viscoelastic Segments (error),
+:class:`Workspace` and interface laws are not available.
+
+Requires Python >= 3.8 (:mod:`multiprocessing.shared_memory`).
+"""
+
+import copy
+import os
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .elwaspatid import checkElastic
+from .tiled import initialState, checkBoundary, coefficients, middle, leftEnd, rightEnd
+
+
+class ParallelWaveprop:
+    """Multi-process :class:`Waveprop` computation of a long bar."""
+
+    def __init__(self, bar, incw, nstep=0, left='free', right='free', Vinit=0,
+                 indV=None, nproc=None, sync=1, nodes=None):
+        """Compute propagation of incident wave in the given bar.
+
+        :param obj bar: instance of :class:`BarSingle` or :class:`BarSet`
+        :param array incw: incident wave
+        :param int nstep: number of calculation steps (if 0, length of **incw**)
+        :param str left: left boundary condition ('free', 'fixed' or 'infinite') after the end of **incw**
+        :param str right: right boundary condition ('free', 'fixed' or 'infinite')
+        :param float Vinit: initial bar velocity (see :class:`Waveprop`)
+        :param int indV: index of end of impact section (see :class:`Waveprop`)
+        :param int nproc: number of worker processes (default: number of CPUs)
+        :param int sync: number of time steps between halo exchanges (also width of halos)
+        :param array nodes: indices of the nodes to store (default: all)
+        """
+        checkElastic(bar, 'ParallelWaveprop')
+        Z = np.asarray(bar.Z, dtype=float)
+        nX = len(Z) + 1
+        nT = nstep if nstep else len(incw)
+        self.incw = np.asarray(incw, dtype=float)
+        # boundary objects hold the state of the computation: copied so that
+        # the objects given can be shared between computations (as Propagator)
+        left = left if isinstance(left, str) else copy.deepcopy(left)
+        right = right if isinstance(right, str) else copy.deepcopy(right)
+        self.boundary = {'left':left, 'right':right, 'Vinit':Vinit, 'indV':indV}
+        for bc in (left, right):
+            checkBoundary(bc)
+        F0, V0, incw = initialState(Z, incw, Vinit, indV)
+
+        if nodes is None:
+            nodes = np.arange(nX)
+        nodes = np.asarray(nodes, dtype=int)
+        if nproc is None:
+            nproc = os.cpu_count() or 1
+        # halos must come from the direct neighbours only
+        nproc = max(1, min(nproc, nX//max(sync, 2)))
+        bounds = np.linspace(0, nX, nproc+1).astype(int)
+
+        shapes = {'Z':(nX-1,), 'incw':(len(incw),), 'F':(nX,), 'V':(nX,),
+                  'Fout':(nT, len(nodes)), 'Vout':(nT, len(nodes))}
+        shms = {kk:shared_memory.SharedMemory(create=True, size=max(8*int(np.prod(ss)), 1))
+                for kk, ss in shapes.items()}
+        try:
+            arr = {kk:np.ndarray(shapes[kk], dtype=float, buffer=shms[kk].buf) for kk in shapes}
+            arr['Z'][:] = Z
+            arr['incw'][:] = incw
+            arr['F'][:] = F0
+            arr['V'][:] = V0
+            names = {kk:shms[kk].name for kk in shms}
+            args = (bounds, names, shapes, nT, sync, left, right, bar.dt, nodes)
+            if nproc==1:
+                _worker(0, *args, barrier=None)
+            else:
+                ctx = mp.get_context()
+                barrier = ctx.Barrier(nproc)
+                procs = [ctx.Process(target=_worker, args=(rank,)+args, kwargs={'barrier':barrier})
+                         for rank in range(nproc)]
+                for pp in procs:
+                    pp.start()
+                for pp in procs:
+                    pp.join()
+                if any([pp.exitcode!=0 for pp in procs]):
+                    raise RuntimeError("A worker process failed")
+            Force = arr['Fout'].copy()
+            Veloc = arr['Vout'].copy()
+            del arr
+        finally:
+            for shm in shms.values():
+                shm.close()
+                shm.unlink()
+
+        self.bar = bar
+        self.nproc = nproc
+        self.sync = sync
+        self.nodes = nodes
+        self.x = np.asarray(bar.x)[nodes]  # position of the stored nodes
+        self.time = np.arange(nT)*bar.dt
+        self.Force = Force
+        self.Veloc = Veloc
+        self.Displ = np.cumsum(Veloc*bar.dt, axis=0)
+
+
+def _worker(rank, bounds, names, shapes, nT, sync, left, right, dt, nodes, barrier=None):
+    """Step the chunk of nodes of a worker, exchanging halos every **sync** steps
+
+    :param int rank: index of the worker
+    :param array bounds: first node of each chunk (and number of nodes)
+    :param dict names: names of the shared memory blocks
+    :param dict shapes: shapes of the shared arrays
+    :param int nT: number of time steps
+    :param int sync: number of time steps between halo exchanges
+    :param str left: left boundary condition
+    :param str right: right boundary condition
+    :param float dt: time step
+    :param array nodes: indices of the nodes to store
+    :param obj barrier: :class:`multiprocessing.Barrier` shared by the workers
+    """
+    shms = {kk:shared_memory.SharedMemory(name=nn) for kk, nn in names.items()}
+    try:
+        arr = {kk:np.ndarray(shapes[kk], dtype=float, buffer=shms[kk].buf) for kk in shapes}
+        nX = shapes['F'][0]
+        a, b = bounds[rank], bounds[rank+1]
+        lo, hi = max(a-sync, 0), min(b+sync, nX)  # chunk with halos
+        first, last = lo==0, hi==nX
+        Z = arr['Z'][lo:hi-1].copy()
+        incw = arr['incw'].copy()
+        for bc, end in ((left, first), (right, last)):
+            if end and not isinstance(bc, str):
+                bc.initCalc(dt, nT)
+        F = arr['F'][lo:hi].copy()
+        V = arr['V'][lo:hi].copy()
+        if barrier is not None:
+            barrier.wait()  # initial state read by all the workers
+        Fn = F.copy()
+        Vn = V.copy()
+        own = np.nonzero((nodes>=a) & (nodes<b))[0]  # stored nodes of this worker
+        loc = nodes[own] - lo
+        arr['Fout'][0, own] = F[loc]
+        arr['Vout'][0, own] = V[loc]
+
+        coef = coefficients(Z)
+        tmp = np.zeros((2, len(F)))
+        for it in range(1, nT):
+            if first:
+                leftEnd(it, F, V, Fn, Vn, arr['Z'], left, incw)
+            if last:
+                rightEnd(it, F, V, Fn, Vn, arr['Z'], right)
+            # Middle of the chunk. Nodes next to a halo end get wrong values,
+            # the valid part shrinks by one node per time step.
+            middle(F, V, Fn, Vn, coef, tmp)
+            F, Fn = Fn, F
+            V, Vn = Vn, V
+            arr['Fout'][it, own] = F[loc]
+            arr['Vout'][it, own] = V[loc]
+
+            if barrier is not None and it%sync==0 and it<nT-1:
+                # exchange halos
+                arr['F'][a:b] = F[a-lo:b-lo]
+                arr['V'][a:b] = V[a-lo:b-lo]
+                barrier.wait()
+                F[:] = arr['F'][lo:hi]
+                V[:] = arr['V'][lo:hi]
+                barrier.wait()
+        del arr
+    finally:
+        for shm in shms.values():
+            shm.close()
+
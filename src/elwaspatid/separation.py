@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Separation of the rightgoing and leftgoing waves from the signals of two (or
+more) gauges on the same bar.
+
+When the incident and reflected waves overlap at a gauge, they cannot be
+separated in time. With the force measured at several positions of a bar of
+known wave celerity **co**, the waves are separated in the frequency domain
+(least squares per frequency) and propagated to any section of the bar::
+
+    test = WP2(bar, incw, nstep=3000)
+    sep = WaveSeparation.fromWP2(test, x=[0.3, 0.5])
+    Fr, Fl = sep.separate(sep.signals, at=0.45)  # waves at x=0.45
+    Vr, Vl = -Fr/sep.Z, Fl/sep.Z  # velocities of the waves
+
+The signals of a batch of runs (same bar, same gauges) are separated at once:
+**signals** is an array of shape (nrun, ngauge, nT) (see
+:meth:`WaveSeparation.fromRuns`), the waves then have shape (nrun, nT).
+
+The separation is singular at the frequencies for which the distance between
+the gauges is a multiple of the half-wavelength. As in :mod:`transfer`, an
+exponential window (complex frequency) damps the contributions wrapped around
+by the FFT and keeps the separation regular. The FFT length, the window and
+the least squares operator of each frequency only depend on the gauges, the
+time step and the duration: they are computed once and cached (see
+:func:`separationPlan`).
+"""
+
+import warnings
+from functools import lru_cache
+
+import numpy as np
+
+
+@lru_cache(maxsize=32)
+def separationPlan(nT, dt, tau, alias=1e-6, eps=0.):
+    """Cached data of the separation of waves.
+
+    :param int nT: number of time steps of the signals
+    :param float dt: time step
+    :param tuple tau: travel times from the reference section to each gauge
+    :param float alias: residual amplitude of the wrapped-around contributions
+    :param float eps: Tikhonov regularization (relative to the number of gauges)
+    :returns: nfft, sigma, complex frequencies (nf,), least squares operator (nf, 2, ngauge)
+    """
+    nfft = 2**int(np.ceil(np.log2(2*nT)))
+    sigma = -np.log(alias)/(nfft*dt)
+    s = sigma + 2j*np.pi*np.fft.rfftfreq(nfft, dt)
+    tau = np.asarray(tau)
+    # force at gauge j: exp(-s*tau_j)*right + exp(s*tau_j)*left
+    A = np.stack((np.exp(-np.outer(s, tau)), np.exp(np.outer(s, tau))), axis=2)
+    AH = np.conj(np.transpose(A, (0, 2, 1)))
+    P = np.linalg.solve(AH @ A + eps*len(tau)*np.eye(2), AH)
+    return nfft, sigma, s, P
+
+
+class WaveSeparation:
+    """Separation of the waves from the signals of gauges on a bar of
+    constant properties.
+    """
+
+    def __init__(self, x, co, Z, dt, nT, alias=1e-6, eps=0.):
+        """
+
+        :param array x: positions of the gauges
+        :param float co: wave celerity in the bar
+        :param float Z: impedance of the bar
+        :param float dt: time step of the signals
+        :param int nT: number of time steps of the signals
+        :param float alias: residual amplitude of the wrapped-around contributions (exponential window)
+        :param float eps: Tikhonov regularization of the least squares (0: none)
+        """
+        x = np.asarray(x, dtype=float)
+        if len(x)<2 or len(np.unique(x))<2:
+            raise ValueError("At least two gauges at different positions are needed")
+        self.x = x
+        self.xref = x.min()
+        self.co = co
+        self.Z = Z
+        self.dt = dt
+        self.nT = nT
+        self.time = np.arange(nT)*dt
+        self.alias = alias
+        self.eps = eps
+        self.signals = None
+
+    @classmethod
+    def fromWP2(cls, prop, x, iseg=None, **kw):
+        """Gauges on a :class:`WP2` computation. The signals are stored in
+        :attr:`signals` (ngauge, nT).
+
+        :param obj prop: :class:`WP2` object
+        :param list x: positions of the gauges
+        :param int iseg: index of the Segment (**x** are then local coordinates)
+        :param kw: other arguments of :class:`WaveSeparation`
+        """
+        sep = cls.fromRuns([prop], x, iseg, **kw)
+        sep.signals = sep.signals[0]  # single run: same shape as getSignal
+        return sep
+
+    @classmethod
+    def fromRuns(cls, props, x, iseg=None, **kw):
+        """Gauges on a batch of :class:`WP2` computations with the same bar in
+        the region of the gauges. The signals are stored in :attr:`signals`
+        (nrun, ngauge, nT).
+
+        :param list props: :class:`WP2` objects
+        :param list x: positions of the gauges
+        :param int iseg: index of the Segment (**x** are then local coordinates)
+        :param kw: other arguments of :class:`WaveSeparation`
+        """
+        signals = []
+        segs = set()
+        for pp in props:
+            sig = []
+            pos = []
+            for xx in x:
+                F, _, (xg, _, ig) = pp.getSignal(float(xx), iseg=iseg, plot=False, Displ=False)
+                sig.append(F)
+                pos.append(xg)  # position of the node
+                segs.add(int(ig))
+            signals.append(sig)
+        if len(segs)>1:
+            raise ValueError("The gauges must be on the same Segment (Segments %s)"%sorted(segs))
+        seg = props[0].bar.seg[ig]
+        if np.ptp(seg.Z)>0:
+            warnings.warn("The impedance of the Segment is not constant: Z=%g is used"%seg.Z[0])
+        sep = cls(pos, seg.dx/seg.dt, seg.Z[0], seg.dt, len(signals[0][0]), **kw)
+        sep.signals = np.array(signals)
+        return sep
+
+    def plan(self):
+        """Cached data of the separation (see :func:`separationPlan`)"""
+        tau = tuple(np.round((self.x - self.xref)/self.co, 15))
+        return separationPlan(self.nT, self.dt, tau, self.alias, self.eps)
+
+    def separate(self, signals=None, at=None):
+        """Rightgoing and leftgoing force waves at a section of the bar.
+
+        The velocities are -Fr/Z and Fl/Z, the force is Fr+Fl. Outside the
+        gauges, the end of the waves needs signals after the last time step:
+        the last (distance to the nearest gauge)/co of the waves are wrong.
+
+        :param array signals: force signals (ngauge, nT) or (nrun, ngauge, nT) (default: :attr:`signals`)
+        :param float at: position of the section (default: first gauge)
+        :returns: Fr, Fl (nT,) for signals (ngauge, nT), or (nrun, nT)
+        """
+        if signals is None:
+            signals = self.signals
+        signals = np.asarray(signals, dtype=float)
+        if at is None:
+            at = self.x[0]
+        nfft, sigma, s, P = self.plan()
+        win = np.exp(-sigma*self.time)
+        spec = np.fft.rfft(signals*win, n=nfft, axis=-1)  # (..., ngauge, nf)
+        # least squares for each frequency: (..., 2, nf)
+        RL = np.einsum('fwg,...gf->...wf', P, spec)
+        ts = (at - self.xref)/self.co
+        RL[..., 0, :] *= np.exp(-s*ts)
+        RL[..., 1, :] *= np.exp(s*ts)
+        waves = np.fft.irfft(RL, n=nfft, axis=-1)[..., :self.nT]/win
+        return waves[..., 0, :], waves[..., 1, :]
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Analysis of Split Hopkinson Pressure Bar (SHPB) tests from the signals of
+virtual gauges on the input and output bars.
+
+The incident and reflected waves are taken from the input gauge, the
+transmitted wave from the output gauge. They are time-shifted to the faces
+of the sample, which gives the forces and velocities of both faces, and then
+the force, strain rate and strain of the sample (1-wave, 2-wave and 3-wave
+analyses) and an equilibrium indicator::
+
+    test = WP2(BarSet([E, E, Es, E], [rho, rho, rhos, rho], [.6, 3, .05, 3.1],
+                      [0.028, 0.030, 0.025, 0.030], nmin=4), nstep=4000, Vinit=5)
+    shpb = SHPB.fromWP2(test, isample=2)
+    shpb.plot()
+    shpb.force[3]  # 3-wave force in the sample
+
+All the signals are arrays of shape (nrun, nT): a batch of simulated tests
+(eg. a parameter sweep with the same bars and time step) is processed at
+once with :meth:`SHPB.fromRuns`, or directly from arrays of gauge signals.
+
+Signs are those of the solvers: compressive force is negative, velocity is
+positive towards the output bar, strain and strain rate are negative in
+compression. The gauges must be far enough from the sample so that the
+incident and reflected waves do not overlap (see :mod:`separation`
+otherwise). The analysis is valid until the next rightgoing wave passes the
+input gauge: the reflected wave reflected again by the impacted end of the
+input bar (attribute :attr:`SHPB.tend`, computed by :meth:`SHPB.fromRuns`
+from the position of the gauge).
+"""
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+
+class SHPB:
+    """SHPB analysis of a batch of gauge signals."""
+
+    def __init__(self, ginp, gout, dt, d1, d2, Z1, Z2, Ls, As, tref=None, thr=0.05, d0=None):
+        """
+
+        :param array ginp: force signals of the input gauge (nrun, nT) or (nT,)
+        :param array gout: force signals of the output gauge
+        :param float dt: time step
+        :param float d1: travel time from input gauge to the sample [s]
+        :param float d2: travel time from the sample to output gauge [s]
+        :param float Z1: impedance of the input bar
+        :param float Z2: impedance of the output bar
+        :param float Ls: length of the sample (or array (nrun, 1), one per run)
+        :param float As: cross-section of the sample (or array (nrun, 1), one per run)
+        :param array tref: arrival time of the reflected wave at the input gauge (default: detected arrival of the incident wave + 2 **d1**)
+        :param float thr: threshold (relative to the maximum) for the detection of the incident wave
+        :param float d0: travel time from the impacted end of the input bar to the input gauge [s] (default: **d1**, gauge in the middle of the input bar)
+        """
+        ginp = np.atleast_2d(np.asarray(ginp, dtype=float))
+        gout = np.atleast_2d(np.asarray(gout, dtype=float))
+        nrun, nT = ginp.shape
+        time = np.arange(nT)*dt
+        if tref is None:
+            # arrival of the incident wave at the input gauge
+            big = np.abs(ginp)>thr*np.abs(ginp).max(axis=1, keepdims=True)
+            tinc = np.argmax(big, axis=1)*dt
+            tref = tinc + 2*d1
+        tref = np.broadcast_to(np.asarray(tref, dtype=float).reshape(-1, 1), (nrun, 1))
+        reflected = time[None, :]>=tref-dt/2
+        # waves at the faces of the sample
+        self.inc = shift(np.where(reflected, 0, ginp), d1/dt)
+        self.ref = shift(np.where(reflected, ginp, 0), -d1/dt)
+        self.tra = shift(gout, -d2/dt)
+        self.time = time
+        self.dt = dt
+        self.Z1 = Z1
+        self.Z2 = Z2
+        self.Ls = Ls
+        self.As = As
+        self.tref = tref[:, 0]
+        if d0 is None:
+            d0 = d1
+        # reflected wave back at the gauge after 2*d0, at the faces of the sample
+        self.tend = self.tref + min(d1, 2*d0 - d1)
+        self.compute()
+
+    @classmethod
+    def fromWP2(cls, prop, isample, x1=None, x2=None, **kw):
+        """SHPB analysis of a :class:`WP2` computation.
+
+        The input bar is the Segment before the sample, the output bar the
+        Segment after.
+
+        :param obj prop: :class:`WP2` object (or a list of them, see :meth:`fromRuns`)
+        :param int isample: index of the Segment of the sample
+        :param float x1: position of the input gauge, local coordinate (default: middle of the input bar)
+        :param float x2: position of the output gauge, local coordinate (default: middle of the output bar)
+        :param kw: other arguments of :class:`SHPB`
+        """
+        return cls.fromRuns([prop], isample, x1, x2, **kw)
+
+    @classmethod
+    def fromRuns(cls, props, isample, x1=None, x2=None, **kw):
+        """SHPB analysis of a batch of :class:`WP2` computations with the same
+        bars and time step (eg. sweep on the sample properties, with the time
+        step given to :class:`BarSet`). The section and length of the sample
+        are computed for each run.
+
+        :param list props: :class:`WP2` objects
+        :param int isample: index of the Segment of the sample
+        :param float x1: position of the input gauge, local coordinate (default: middle of the input bar)
+        :param float x2: position of the output gauge, local coordinate (default: middle of the output bar)
+        :param kw: other arguments of :class:`SHPB`
+        """
+        bar = props[0].bar
+        sinp, sout = bar.seg[isample-1], bar.seg[isample+1]
+        for pp in props[1:]:
+            if not pp.bar.dt==bar.dt:
+                raise ValueError("The runs must have the same time step")
+            for ii in (isample-1, isample+1):
+                ss, ref = pp.bar.seg[ii], bar.seg[ii]
+                if not (ss.nX==ref.nX and ss.dx==ref.dx and np.array_equal(ss.Z, ref.Z)):
+                    raise ValueError("The runs must have the same input and output bars")
+        i1 = sinp.nX//2 if x1 is None else np.where(x1>=sinp.xloc)[0][-1]
+        i2 = sout.nX//2 if x2 is None else np.where(x2>=sout.xloc)[0][-1]
+        ginp = np.array([pp.bar.seg[isample-1].Force[:, i1] for pp in props])
+        gout = np.array([pp.bar.seg[isample+1].Force[:, i2] for pp in props])
+        dt = bar.dt
+        d1 = (sinp.nX - 1 - i1)*dt  # one element per time step
+        d2 = i2*dt
+        # sample properties of each run (Z = A*E/co)
+        As = np.array([ss.Z.mean()*ss.dx/ss.dt/ss.E for ss in [pp.bar.seg[isample] for pp in props]])
+        Ls = np.array([pp.bar.seg[isample].x[-1] - pp.bar.seg[isample].x[0] for pp in props])
+        kw.setdefault('d0', i1*dt)
+        return cls(ginp, gout, dt, d1, d2, sinp.Z[-1], sout.Z[0], Ls[:, None], As[:, None], **kw)
+
+    def compute(self):
+        """Forces, velocities, strain rates and strains of the sample"""
+        inc, ref, tra = self.inc, self.ref, self.tra
+        #---FACES OF THE SAMPLE---
+        self.F1 = inc + ref  # input face
+        self.F2 = tra  # output face
+        self.V1 = (ref - inc)/self.Z1  # rightgoing wave: F=-ZV
+        self.V2 = -tra/self.Z2
+        #---FORCE IN THE SAMPLE---
+        self.force = {1:self.F2, 2:self.F1, 3:(self.F1 + self.F2)/2}
+        self.stress = {kk:vv/self.As for kk, vv in self.force.items()}
+        #---STRAIN RATE AND STRAIN---
+        # 1-wave: transmitted force replaced by F1 (equilibrium), which gives
+        # -2*ref/(Z*Ls) for identical bars
+        rate1 = (-(inc + ref)/self.Z2 - (ref - inc)/self.Z1)/self.Ls
+        rate3 = (self.V2 - self.V1)/self.Ls
+        self.rate = {1:rate1, 3:rate3}
+        self.strain = {kk:np.cumsum(vv, axis=1)*self.dt for kk, vv in self.rate.items()}
+        #---EQUILIBRIUM---
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.R = np.where(self.F1 + self.F2==0, 0,
+                              2*np.abs(self.F1 - self.F2)/np.abs(self.F1 + self.F2))
+
+    def equilibrium(self, tol=0.05, level=0.5):
+        """Fraction of the loading time with equilibrium of the sample (before
+        :attr:`tend`).
+
+        :param float tol: maximum relative difference of the forces on the faces
+        :param float level: the loading time is when the 3-wave force is above this fraction of its maximum
+        :returns: fraction of each run (array)
+        """
+        F = np.where(self.time[None, :]<self.tend[:, None], np.abs(self.force[3]), 0)
+        load = F>=level*F.max(axis=1, keepdims=True)
+        return np.sum(load & (self.R<=tol), axis=1)/np.maximum(np.sum(load, axis=1), 1)
+
+    def plot(self, irun=0, figname=None, time='µs'):
+        """Plot forces, strain rate and stress-strain curve of a run.
+
+        :param int irun: index of the run
+        :param str figname: name for the figure
+        :param str time: time scale ('µs' or 'ms')
+        """
+        scale = 1e6 if time=='µs' else 1e3
+        tt = self.time*scale
+        valid = self.time<self.tend[irun]
+        plt.figure(figname)
+        ax = plt.subplot(311)
+        plt.plot(tt, self.F1[irun], label='input face (2-wave)')
+        plt.plot(tt, self.F2[irun], label='output face (1-wave)')
+        plt.plot(tt, self.force[3][irun], 'k--', label='3-wave')
+        plt.ylabel('Force [N]')
+        plt.legend()
+        plt.box(False)
+        plt.subplot(312, sharex=ax)
+        plt.plot(tt, self.rate[1][irun], label='1-wave')
+        plt.plot(tt, self.rate[3][irun], label='3-wave')
+        plt.ylabel('Strain rate [1/s]')
+        plt.xlabel('t [%s]'%time)
+        plt.legend()
+        plt.box(False)
+        plt.subplot(313)
+        plt.plot(self.strain[3][irun, valid], self.stress[3][irun, valid]/1e6)
+        plt.xlabel('Strain [-]')
+        plt.ylabel('Stress [MPa]')
+        plt.box(False)
+
+
+def shift(sig, n):
+    """Delay signals by a (fractional) number of time steps, with linear
+    interpolation. Zeros enter the signals.
+
+    :param array sig: signals (nrun, nT)
+    :param float n: delay in time steps (negative: advance), scalar or one per run
+    :returns: shifted signals, same shape
+    """
+    sig = np.atleast_2d(sig)
+    nrun, nT = sig.shape
+    n = np.broadcast_to(np.asarray(n, dtype=float).reshape(-1, 1), (nrun, 1))
+    src = np.arange(nT)[None, :] - n  # position in the original signal
+    i0 = np.floor(src).astype(int)
+    ff = src - i0
+    pad = np.hstack((sig, np.zeros((nrun, 1))))  # index -1 and nT give zero
+    valid0 = (i0>=0) & (i0<nT)
+    valid1 = (i0+1>=0) & (i0+1<nT)
+    s0 = np.take_along_axis(pad, np.where(valid0, i0, nT), axis=1)
+    s1 = np.take_along_axis(pad, np.where(valid1, i0+1, nT), axis=1)
+    return (1 - ff)*s0 + ff*s1
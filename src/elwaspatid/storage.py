@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+"""
+Save and load results of :class:`WP2` and :class:`Waveprop` computations.
+
+Two file formats are available:
+
+* HDF5 (``.h5`` or ``.hdf5``), requires the optional :mod:`h5py` package. The
+  space-time arrays are chunked along time and compressed;
+* NumPy ``.npz`` archive (fallback when :mod:`h5py` is not installed). The
+  archive is not compressed, so that its arrays can be memory-mapped.
+
+The bar (with its :class:`Segment` list) and the boundary conditions are saved
+along with the results::
+
+    prop = WP2(bar, incw, nstep=1000)
+    save(prop, 'run.h5')
+
+    prop = load('run.h5')
+    F, V, D, _ = prop.getSignal(x=0.5)
+
+Loading is lazy: the space-time arrays are read from the file only when
+sliced (see :class:`LazyArray`), so that :meth:`WP2.getSignal`,
+:meth:`Waveprop.getcut` or the plotting methods read only what they need.
+The HDF5 file therefore stays open: close it with the ``close()`` method of
+the loaded object, or use :func:`opened`::
+
+    with opened('run.h5') as prop:
+        F, V, D, _ = prop.getSignal(x=0.5)
+"""
+
+import json
+import zipfile
+from contextlib import contextmanager
+
+import numpy as np
+
+from .elwaspatid import WP2, Waveprop, BarSingle, BarSet, Segment, ViscoSegment, Bar
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+#: classes which can be rebuilt when loading a file
+CLASSES = {cc.__name__:cc for cc in (WP2, Waveprop, BarSingle, BarSet, Segment, ViscoSegment, Bar)}
+
+#: space-time arrays saved for each kind of result
+FIELDS = {'WP2':('Force', 'Veloc', 'Displ'),
+          'Waveprop':('Force', 'Veloc', 'Displ', 'Strain', 'Stress', 'LR', 'state')}
+
+#: per Segment space-time arrays (WP2 only)
+SEGFIELDS = ('Strain', 'Stress')
+
+#: attributes of a Segment which are not part of the bar definition
+SEGRESULTS = ('Force', 'Veloc', 'Displ', 'Strain', 'Stress', 'time', 'nT',
+              'active', 'q', '_relax', '_weight', '_qwork', '_Zsum', '_Zprod', '_work')
+
+
+class LazyArray(np.lib.mixins.NDArrayOperatorsMixin):
+    """Read-only 2D array (time versus space) stored in a file.
+
+    Data is only read when the array is sliced. Conversion to a
+    :class:`numpy.ndarray` (eg. for plotting, or with arithmetic operators)
+    reads all the data.
+    """
+
+    def __init__(self, data, cols=None):
+        """
+
+        :param obj data: sliceable 2D data (:class:`h5py.Dataset` or :class:`numpy.memmap`)
+        :param tuple cols: (start, stop) columns of **data** to consider
+        """
+        if cols is None:
+            cols = (0, data.shape[1])
+        self.data = data
+        self.cols = cols
+
+    @property
+    def shape(self):
+        return (self.data.shape[0], self.cols[1]-self.cols[0])
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        """Read the given slice from the file."""
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        rows, cols = key
+        cols = np.arange(*self.cols)[cols]
+        if cols.ndim==0:
+            return self.data[rows, int(cols)]
+        if len(cols) and np.all(np.diff(cols)==1):
+            # contiguous columns: a single slice is read
+            return self.data[rows, cols[0]:cols[-1]+1]
+        return np.asarray(self.data[rows, :])[..., cols]
+
+    def __array__(self, dtype=None, copy=None):
+        arr = np.asarray(self.data[:, self.cols[0]:self.cols[1]])
+        if dtype is not None:
+            arr = arr.astype(dtype)
+        return arr
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = [np.asarray(ii) if isinstance(ii, LazyArray) else ii for ii in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def min(self):
+        """Minimum, computed block by block along time."""
+        return min([self[ii:ii+self._block(), :].min() for ii in range(0, len(self), self._block())])
+
+    def max(self):
+        """Maximum, computed block by block along time."""
+        return max([self[ii:ii+self._block(), :].max() for ii in range(0, len(self), self._block())])
+
+    def _block(self):
+        """Number of lines read at once by :meth:`min` and :meth:`max`"""
+        try:
+            return max(self.data.chunks[0], 1)
+        except (AttributeError, TypeError):
+            return max(2**20//max(self.shape[1], 1), 1)
+
+    def __repr__(self):
+        return 'LazyArray(shape=%s, dtype=%s)'%(self.shape, self.dtype)
+
+
+def save(prop, path, fmt=None, chunk=256, compression='gzip'):
+    """Save :class:`WP2` or :class:`Waveprop` results, with bar and boundary conditions.
+
+    :param obj prop: :class:`WP2` or :class:`Waveprop` object
+    :param str path: file name
+    :param str fmt: 'h5' or 'npz' (guessed from **path** extension if None)
+    :param int chunk: number of time steps in each HDF5 chunk
+    :param str compression: HDF5 compression filter
+    """
+    fmt = _getFormat(path, fmt)
+    typ = prop.__class__.__name__
+    if typ not in FIELDS:
+        raise TypeError("Can only save WP2 or Waveprop objects, not %s"%typ)
+
+    # ---SPACE-TIME ARRAYS---
+    fields = {ff:getattr(prop, ff) for ff in FIELDS[typ]}
+    if typ=='WP2':
+        fields.update({'seg/%i/%s'%(ii, ff):getattr(ss, ff)
+                       for ii, ss in enumerate(prop.bar.seg) for ff in SEGFIELDS})
+
+    # ---OTHER ARRAYS AND METADATA---
+    arrays = {'time':prop.time}
+    if typ=='WP2':
+        bar = prop.bar
+        arrays.update({'indF':prop.indF, 'indV':prop.indV, 'xnodes':prop.xnodes,
+                       'contact':np.array(prop.contact['state'])})
+        extra = {'contactLoss':prop.contact['threshold'],
+                 'interfaces':getattr(prop, 'interfaces', None)}
+    else:
+        bar = prop.bar_discret
+        extra = {}
+    if getattr(prop, 'incw', None) is not None:
+        arrays['incw'] = np.asarray(prop.incw)
+    arrays['xplot'] = prop.xplot
+    barmeta = _flatten(bar, 'bar/', arrays, exclude=SEGRESULTS)
+    meta = {'class':typ, 'bar':barmeta, 'boundary':getattr(prop, 'boundary', None),
+            'manifest':getattr(prop, 'manifest', None), 'extra':extra}
+
+    if fmt=='h5':
+        with h5py.File(path, 'w') as f:
+            f.attrs['meta'] = json.dumps(meta, default=_jsonDefault)
+            for name, arr in arrays.items():
+                f.create_dataset(name, data=arr)
+            for name, arr in fields.items():
+                nT, nX = arr.shape
+                ds = f.create_dataset(name, shape=(nT, nX), dtype=arr.dtype,
+                                      chunks=(max(min(chunk, nT), 1), max(nX, 1)),
+                                      compression=compression, shuffle=True)
+                for ii in range(0, nT, chunk):
+                    ds[ii:ii+chunk] = arr[ii:ii+chunk]
+    elif fmt=='npz':
+        arrays.update({name:np.asarray(arr) for name, arr in fields.items()})
+        arrays['meta'] = np.array(json.dumps(meta, default=_jsonDefault))
+        # not compressed, so that arrays can be memory-mapped
+        np.savez(path, **arrays)
+
+
+def load(path, fmt=None):
+    """Load results saved with :func:`save`.
+
+    The returned object is a :class:`WP2` or :class:`Waveprop` instance whose
+    space-time arrays are :class:`LazyArray` objects (HDF5) or read-only
+    :class:`numpy.memmap` (npz): nothing is read until sliced.
+
+    An HDF5 file is kept open as long as the object is alive (it cannot be
+    overwritten or deleted meanwhile on some systems): call the ``close()``
+    method of the object when done (the space-time arrays cannot be read
+    any more), or use :func:`opened`. For npz files, ``close()`` does
+    nothing: the memory maps are released with the arrays.
+
+    :param str path: file name
+    :param str fmt: 'h5' or 'npz' (guessed from **path** extension if None)
+    """
+    fmt = _getFormat(path, fmt)
+    if fmt=='h5':
+        f = h5py.File(path, 'r')
+        meta = json.loads(f.attrs['meta'])
+        store = _H5Store(f)
+    elif fmt=='npz':
+        store = _NpzStore(path)
+        meta = json.loads(str(store.array('meta')))
+
+    typ = meta['class']
+    prop = CLASSES[typ].__new__(CLASSES[typ])
+    prop.close = store.close
+    bar = _unflatten(meta['bar'], 'bar/', store)
+    prop.time = store.array('time')
+    prop.xplot = store.array('xplot')
+    prop.boundary = meta['boundary']
+    prop.manifest = meta.get('manifest')
+    prop.incw = store.array('incw') if store.has('incw') else None
+    for ff in FIELDS[typ]:
+        setattr(prop, ff, store.lazy(ff))
+
+    if typ=='WP2':
+        prop.bar = bar
+        prop.indF = store.array('indF')
+        prop.indV = store.array('indV')
+        prop.xnodes = store.array('xnodes')
+        prop._Force = prop.Force
+        prop.contact = {'state':list(store.array('contact')),
+                        'threshold':meta['extra']['contactLoss']}
+        if meta['extra'].get('interfaces') is not None:
+            prop.interfaces = meta['extra']['interfaces']  # parameters of the laws (dict)
+        # Segment arrays are lazy views on the global arrays
+        for ii, ss in enumerate(bar.seg):
+            iF, iV = int(prop.indF[ii]), int(prop.indV[ii])
+            ss.Force = store.lazy('Force', (iF, iF+ss.nX))
+            ss.Veloc = store.lazy('Veloc', (iV, iV+ss.nX))
+            ss.Displ = store.lazy('Displ', (iV, iV+ss.nX))
+            for ff in SEGFIELDS:
+                setattr(ss, ff, store.lazy('seg/%i/%s'%(ii, ff)))
+            ss.nT = len(prop.time)
+            ss.setTime(prop.time)
+    else:
+        prop.bar_discret = bar
+    return prop
+
+
+@contextmanager
+def opened(path, fmt=None):
+    """Load results saved with :func:`save` (see :func:`load`), and close the
+    file at the end of the ``with`` block.
+
+    :param str path: file name
+    :param str fmt: 'h5' or 'npz' (guessed from **path** extension if None)
+    """
+    prop = load(path, fmt)
+    try:
+        yield prop
+    finally:
+        prop.close()
+
+
+def _getFormat(path, fmt=None):
+    """Get file format from file extension, check that it is available.
+
+    :param str path: file name
+    :param str fmt: 'h5' or 'npz'. Guessed from **path** if None
+    """
+    if fmt is None:
+        ext = str(path).rsplit('.', 1)[-1].lower()
+        if ext in ('h5', 'hdf5'):
+            fmt = 'h5'
+        elif ext=='npz':
+            fmt = 'npz'
+        else:
+            fmt = 'npz' if h5py is None else 'h5'
+    if fmt=='h5' and h5py is None:
+        raise ImportError("h5py is required for HDF5 files, use 'npz' format instead")
+    if fmt not in ('h5', 'npz'):
+        raise ValueError("Unknown file format: %s"%fmt)
+    return fmt
+
+
+def _jsonDefault(obj):
+    """Convert NumPy scalars and arrays, and boundary objects (see
+    :mod:`boundaries`) for :func:`json.dumps`"""
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return obj.tolist()
+    if hasattr(obj, 'parameters'):
+        return dict(obj.parameters, **{'class':type(obj).__name__})
+    raise TypeError("%s is not JSON serializable"%type(obj))
+
+
+def _flatten(obj, prefix, arrays, exclude=()):
+    """Describe object attributes: arrays are added to **arrays**, other
+    attributes are returned in a JSON-compatible dict.
+
+    :param obj obj: object to describe (bar, segment...)
+    :param str prefix: prefix for the names of the arrays
+    :param dict arrays: dict of arrays to fill
+    :param tuple exclude: attributes to ignore
+    """
+    meta = {'class':obj.__class__.__name__, 'attrs':{}, 'arrays':[],
+            'objects':{}, 'lists':{}}
+    for key, val in vars(obj).items():
+        if key in exclude:
+            continue
+        if isinstance(val, np.ndarray):
+            arrays[prefix+key] = val
+            meta['arrays'].append(key)
+        elif val.__class__.__name__ in CLASSES:
+            meta['objects'][key] = _flatten(val, prefix+key+'/', arrays, exclude)
+        elif isinstance(val, list) and val and val[0].__class__.__name__ in CLASSES:
+            meta['lists'][key] = [_flatten(vv, '%s%s/%i/'%(prefix, key, ii), arrays, exclude)
+                                  for ii, vv in enumerate(val)]
+        else:
+            meta['attrs'][key] = val
+    return meta
+
+
+def _unflatten(meta, prefix, store):
+    """Rebuild object described by :func:`_flatten`.
+
+    :param dict meta: description of the object
+    :param str prefix: prefix for the names of the arrays
+    :param obj store: :class:`_H5Store` or :class:`_NpzStore`
+    """
+    cls = CLASSES[meta['class']]
+    obj = cls.__new__(cls)
+    obj.__dict__.update(meta['attrs'])
+    for key in meta['arrays']:
+        setattr(obj, key, store.array(prefix+key))
+    for key, sub in meta['objects'].items():
+        setattr(obj, key, _unflatten(sub, prefix+key+'/', store))
+    for key, subs in meta['lists'].items():
+        setattr(obj, key, [_unflatten(sub, '%s%s/%i/'%(prefix, key, ii), store)
+                           for ii, sub in enumerate(subs)])
+    return obj
+
+
+class _H5Store:
+    """Access to the arrays of an HDF5 file"""
+    def __init__(self, f):
+        self.f = f
+
+    def has(self, name):
+        return name in self.f
+
+    def array(self, name):
+        """Small array, read at once"""
+        return self.f[name][()]
+
+    def lazy(self, name, cols=None):
+        """Space-time array, read on demand"""
+        return LazyArray(self.f[name], cols)
+
+    def close(self):
+        self.f.close()
+
+
+class _NpzStore:
+    """Access to the arrays of an uncompressed .npz file, through memory maps"""
+    def __init__(self, path):
+        self.path = path
+        self.offsets = {}
+        with zipfile.ZipFile(path) as zf, open(path, 'rb') as f:
+            for info in zf.infolist():
+                if info.compress_type!=zipfile.ZIP_STORED:
+                    raise ValueError("Compressed .npz files cannot be memory-mapped")
+                # local file header: 30 bytes, then file name and extra field
+                f.seek(info.header_offset+26)
+                nname, nextra = np.frombuffer(f.read(4), dtype='<u2')
+                f.seek(info.header_offset+30+int(nname)+int(nextra))
+                if np.lib.format.read_magic(f)==(1, 0):
+                    shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+                self.offsets[info.filename[:-4]] = (f.tell(), shape, fortran, dtype)
+
+    def has(self, name):
+        return name in self.offsets
+
+    def array(self, name):
+        offset, shape, fortran, dtype = self.offsets[name]
+        if dtype.hasobject or not shape or 0 in shape:
+            # scalars and empty arrays cannot be memory-mapped
+            with np.load(self.path) as npz:
+                return npz[name][()]
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=offset,
+                         shape=shape, order='F' if fortran else 'C')
+
+    def close(self):
+        pass  # memory maps are closed with the arrays
+
+    def lazy(self, name, cols=None):
+        arr = self.array(name)
+        if cols is not None:
+            arr = arr[:, cols[0]:cols[1]]
+        return arr
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Temporally blocked (cache-tiled) stepping of the :class:`Waveprop` scheme.
+
+:class:`Waveprop` sweeps the whole bar at each time step, streaming all
+the nodes through memory. Here the bar is cut into spatial tiles which are
+advanced **depth** time steps at once in small local buffers (which stay in
+cache). As the stencil only involves the nearest neighbours, a tile with
+halos of **depth** nodes on each side gives the exact state of the tile
+after **depth** steps (overlapped trapezoidal tiling)::
+
+    prop = TiledWaveprop(bar, incw, nstep=10000, tile=16384, depth=32,
+                         rows=np.arange(0, 10000, 10))  # store 1 step out of 10
+    prop.Force  # shape (1000, nX)
+
+Only the requested time steps (**rows**) and nodes (**nodes**) are stored.
+Results are identical to :class:`Waveprop`: the nodes are computed by the
+kernels of :class:`Segment` (:func:`middleState`, :func:`leftState`,
+:func:`rightState`). The tiles are stepped here, not through
+:class:`Propagator`: the ``activity`` tracking (:class:`ActiveSpan`),
+viscoelastic Segments (error), :class:`Workspace` and interface laws are not
+available.
+"""
+
+import copy
+import warnings
+
+import numpy as np
+
+from .elwaspatid import middleState, leftState, rightState, checkElastic
+
+
+class TiledWaveprop:
+    """:class:`Waveprop` computation with temporal blocking."""
+
+    def __init__(self, bar, incw, nstep=0, left='free', right='free', Vinit=0,
+                 indV=None, tile=16384, depth=32, rows=None, nodes=None):
+        """Compute propagation of incident wave in the given bar.
+
+        :param obj bar: instance of :class:`BarSingle` or :class:`BarSet`
+        :param array incw: incident wave
+        :param int nstep: number of calculation steps (if 0, length of **incw**)
+        :param str left: left boundary condition ('free', 'fixed' or 'infinite') after the end of **incw**
+        :param str right: right boundary condition ('free', 'fixed' or 'infinite')
+        :param float Vinit: initial bar velocity (see :class:`Waveprop`)
+        :param int indV: index of end of impact section (see :class:`Waveprop`)
+        :param int tile: number of nodes of the tiles
+        :param int depth: number of time steps of the blocks (at most **tile**)
+        :param array rows: time indices to store (default: all)
+        :param array nodes: indices of the nodes to store (default: all)
+        """
+        checkElastic(bar, 'TiledWaveprop')
+        Z = np.asarray(bar.Z, dtype=float)
+        nX = len(Z) + 1
+        nT = nstep if nstep else len(incw)
+        self.incw = np.asarray(incw, dtype=float)
+        # boundary objects hold the state of the computation: copied so that
+        # the objects given can be shared between computations (as Propagator)
+        left = left if isinstance(left, str) else copy.deepcopy(left)
+        right = right if isinstance(right, str) else copy.deepcopy(right)
+        self.boundary = {'left':left, 'right':right, 'Vinit':Vinit, 'indV':indV}
+        F, V, incw = initialState(Z, incw, Vinit, indV)
+        for bc in (left, right):
+            checkBoundary(bc)
+            if not isinstance(bc, str):
+                bc.initCalc(bar.dt, nT)
+        rows = np.arange(nT) if rows is None else np.unique(rows)
+        nodes = np.arange(nX) if nodes is None else np.unique(nodes)
+        depth = max(1, min(depth, tile))  # halos only come from the neighbouring tiles
+        coef = coefficients(Z)
+
+        irow = np.full(nT, -1)  # index of time step in stored rows
+        irow[rows] = np.arange(len(rows))
+        Force = np.zeros((len(rows), len(nodes)))
+        Veloc = np.zeros((len(rows), len(nodes)))
+        if irow[0]>=0:
+            Force[0] = F[nodes]
+            Veloc[0] = V[nodes]
+
+        # first node of the tiles. The halos must not reach the right end of
+        # the bar, which is only computed by the last tile: the last tile is
+        # extended if it is shorter than depth.
+        starts = list(range(0, nX, tile))
+        if len(starts)>1 and nX-starts[-1]<depth:
+            starts.pop()
+        bounds = starts + [nX]
+        # local buffers of the tiles (with halos)
+        nloc = min(tile+3*depth, nX)
+        Fl, Vl, Fn, Vn = [np.zeros(nloc) for ii in range(4)]
+        tmp = np.zeros((2, nloc))
+        Fnew = np.zeros(nX)
+        Vnew = np.zeros(nX)
+        for t0 in range(0, nT-1, depth):
+            k = min(depth, nT-1-t0)
+            for a, b in zip(bounds[:-1], bounds[1:]):
+                lo, hi = max(a-k, 0), min(b+k, nX)
+                n = hi - lo
+                Fa, Va, Fb, Vb = Fl[:n], Vl[:n], Fn[:n], Vn[:n]
+                Fa[:] = F[lo:hi]
+                Va[:] = V[lo:hi]
+                cc = [cf[lo:hi-2] for cf in coef]
+                jn = slice(np.searchsorted(nodes, a), np.searchsorted(nodes, b))  # stored nodes of the tile
+                loc = nodes[jn] - lo
+                for it in range(t0+1, t0+k+1):
+                    if a==0:
+                        leftEnd(it, Fa, Va, Fb, Vb, Z, left, incw)
+                    if b==nX:
+                        rightEnd(it, Fa, Va, Fb, Vb, Z, right)
+                    middle(Fa, Va, Fb, Vb, cc, tmp)
+                    Fa, Fb = Fb, Fa
+                    Va, Vb = Vb, Va
+                    if irow[it]>=0:
+                        Force[irow[it], jn] = Fa[loc]
+                        Veloc[irow[it], jn] = Va[loc]
+                Fnew[a:b] = Fa[a-lo:b-lo]
+                Vnew[a:b] = Va[a-lo:b-lo]
+            F, Fnew = Fnew, F
+            V, Vnew = Vnew, V
+
+        self.bar = bar
+        self.tile = tile
+        self.depth = depth
+        self.rows = rows
+        self.nodes = nodes
+        self.x = np.asarray(bar.x)[nodes]  # position of the stored nodes
+        self.time = rows*bar.dt  # time of the stored rows
+        self.Force = Force
+        self.Veloc = Veloc
+
+
+#---KERNEL, SHARED WITH parallel MODULE---
+def initialState(Z, incw, Vinit=0, indV=None):
+    """Initial force and velocity, and incident wave, as in :class:`Waveprop`
+
+    :param array Z: impedance of the elements
+    :param array incw: incident wave
+    :param float Vinit: initial bar velocity
+    :param int indV: index of end of impact section
+    """
+    nX = len(Z) + 1
+    F = np.zeros(nX)
+    V = np.zeros(nX)
+    incw = np.asarray(incw, dtype=float)
+    if not Vinit==0 and indV is None:
+        V += Vinit
+        incw = .5*Z[0]*Vinit*np.ones(len(incw))
+        warnings.warn("Incident Wave 'incw' was overwritten")
+    if indV:
+        V[:indV+1] = Vinit
+        incw = np.zeros(0)
+    return F, V, incw
+
+
+def checkBoundary(bc):
+    """Check that the boundary condition is available in the kernel
+
+    :param str bc: boundary condition (or boundary object, see :mod:`boundaries`)
+    """
+    if isinstance(bc, str) and bc not in ('free', 'fixed', 'clamped', 'infinite'):
+        raise ValueError("Boundary condition '%s' not available"%bc)
+
+
+def coefficients(Z):
+    """Coefficients of the middle nodes: Zi, Zi+1, Zi*Zi+1, Zi+Zi+1
+
+    :param array Z: impedance of the elements
+    """
+    Zi = Z[:-1]
+    Zii = Z[1:]
+    return Zi, Zii, Zi*Zii, Zi+Zii
+
+
+def middle(F, V, Fn, Vn, coef, tmp):
+    """Middle nodes at next time step, without temporary arrays
+    (:func:`middleState`, as :meth:`Segment.compMiddle`).
+
+    :param array F: force at previous time step
+    :param array V: velocity at previous time step
+    :param array Fn: force at current time step (filled)
+    :param array Vn: velocity at current time step (filled)
+    :param tuple coef: coefficients, see :func:`coefficients`
+    :param array tmp: work array, shape (2, at least len(F)-2)
+    """
+    Zi, Zii, ZZ, S = coef
+    middleState(F[:-2], F[2:], V[:-2], V[2:], Zi, Zii, ZZ, S, Fn[1:-1], Vn[1:-1],
+                tmp[0, :len(F)-2])
+
+
+def leftEnd(it, F, V, Fn, Vn, Z, left, incw):
+    """Left end of the bar (:func:`leftState`, as :meth:`Segment.compLeft`)"""
+    if it<=len(incw):
+        Fn[0], Vn[0] = leftState(it, F[1], V[1], Z[0], Z[1], 'impact', incw[it-1])
+    else:
+        Fn[0], Vn[0] = leftState(it, F[1], V[1], Z[0], None, left)
+
+
+def rightEnd(it, F, V, Fn, Vn, Z, right):
+    """Right end of the bar (:func:`rightState`, as :meth:`Segment.compRight`)"""
+    Fn[-1], Vn[-1] = rightState(it, F[-2], V[-2], Z[-1], right)
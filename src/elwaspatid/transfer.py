@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Frequency-domain solver for linear bar assemblies (transfer matrices).
+
+Each piece of constant properties of the bar is described by a 2x2 transfer
+matrix (force, velocity) per frequency. The response at any position is
+obtained by an inverse FFT, without time stepping::
+
+    bar = BarSet(E=[210e9, 78e9], rho=[7800, 2800], L=[1, 1.1], d=[0.030, 0.028])
+    incw = trapezeWave(plateau=50, rise=10)
+    tm = TransferMatrix(bar, incw, nstep=20000, right='free')
+    F, V, D, (x, _, iseg) = tm.getSignal(x=1.5)
+
+Compared to :class:`WP2` and :class:`Waveprop`:
+
+* contact loss is not possible: traction crosses the interfaces;
+* the pieces of constant impedance are those of the continuous bar: the
+  lengths given to :class:`BarSet` and the positions given to
+  :meth:`BarSet.changeSection` are not rounded to whole elements (the
+  elements of a :class:`BarSingle` are used as they are);
+* viscoelastic Segments (:meth:`BarSet.setViscoelastic`) are not supported;
+* the incident wave is injected at the left end, the left boundary condition
+  applies to the reflected wave at any time (including during the incident
+  wave, which is different from :class:`WP2` if the bar is short).
+
+The response of a lossless bar does not decay: an exponential window
+(complex frequency) damps the contributions wrapped around by the FFT.
+"""
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from .elwaspatid import scaleTime, ViscoSegment
+
+
+class TransferMatrix:
+    """Propagation of an incident wave in a linear bar assembly, computed in
+    the frequency domain.
+    """
+
+    def __init__(self, bar, incw, nstep=0, left='infinite', right='free',
+                 dt=None, alias=1e-9):
+        """Compute the spectra of the waves at the left end of the bar.
+
+        :param obj bar: bar setup (:class:`BarSet` or :class:`BarSingle`)
+        :param array incw: incident force wave (input at left end)
+        :param int nstep: number of time steps of the output
+        :param str left: left boundary condition for reflected waves ('free', 'fixed' or 'infinite')
+        :param str right: right boundary condition ('free', 'fixed' or 'infinite')
+        :param float dt: time step (default: time step of **bar**)
+        :param float alias: residual amplitude of the wrapped-around response
+        """
+        Z, co, L, owner = _pieces(bar)
+        if dt is None:
+            dt = bar.dt
+        if nstep==0:
+            n_trav = 2.5  # number of wave travels through the entire bar
+            nstep = int(np.ceil(n_trav*np.sum(L/co)/dt))
+            print("Simulation time set to %i travels across all bars."%n_trav)
+        nT = nstep
+        incw = np.asarray(incw, dtype=float)
+
+        # FFT of at least twice the duration; the exponential window exp(-sigma*t)
+        # reduces wrapped-around contributions to alias.
+        nfft = 2**int(np.ceil(np.log2(2*max(nT, len(incw)+1))))
+        sigma = -np.log(alias)/(nfft*dt)
+        s = sigma + 2j*np.pi*np.fft.rfftfreq(nfft, dt)  # complex frequency
+        # same time origin as WP2: incw[i] enters the bar at time (i+1)*dt
+        inc = np.zeros(nfft)
+        inc[1:len(incw)+1] = incw*np.exp(-sigma*dt*np.arange(1, len(incw)+1))
+        I = np.fft.rfft(inc)
+
+        # state (force, velocity) at the left end from the rightgoing (a) and
+        # leftgoing (b) force waves
+        M = np.array([[1, 1], [-1/Z[0], 1/Z[0]]])
+        G = M
+        for zz, cc, ll in zip(Z, co, L):
+            G = transferMatrix(s, zz, cc, ll) @ G
+        # right end condition: c @ state = 0
+        c = {'free':[1, 0], 'fixed':[0, 1], 'clamped':[0, 1], 'infinite':[1, Z[-1]]}[right]
+        g = np.einsum('j,fjk->fk', np.array(c, dtype=float), G)
+        rho = -g[:, 0]/g[:, 1]  # b = rho*a
+        # left end: reflected wave is sent back in the bar
+        r = {'free':-1, 'fixed':1, 'clamped':1, 'infinite':0}[left]
+        a = I/(1 - r*rho)
+        S = np.stack((a + rho*a, (rho*a - a)/Z[0]), axis=-1)  # (force, velocity)
+        # state at the beginning of each piece
+        states = [S]
+        for zz, cc, ll in zip(Z, co, L):
+            S = np.einsum('fjk,fk->fj', transferMatrix(s, zz, cc, ll), S)
+            states.append(S)
+
+        self.incw = incw
+        self.boundary = {'left':left, 'right':right}
+        self.bar = bar
+        self.dt = dt
+        self.nT = nT
+        self.nfft = nfft
+        self.sigma = sigma
+        self.s = s
+        self.Z = Z
+        self.co = co
+        self.L = L
+        self.xo = np.hstack((0, np.cumsum(L)))  # position of the beginning of each piece
+        self.owner = owner  # Segment (BarSet) of each piece
+        first = np.hstack((True, owner[1:]!=owner[:-1]))
+        self.xseg = self.xo[:-1][first]  # position of the beginning of each Segment
+        self.states = np.array(states)
+        self.time = np.arange(nT)*dt
+
+    def state(self, x):
+        """Spectra of force and velocity at given positions.
+
+        :param array x: global positions along the bar
+        :returns: spectra of force and velocity (arrays of shape (len(x), nfreq))
+        """
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        jj = np.clip(np.searchsorted(self.xo, x, side='right')-1, 0, len(self.L)-1)
+        xi = x - self.xo[jj]
+        u = self.s[None, :]*(xi/self.co[jj])[:, None]
+        Z = self.Z[jj][:, None]
+        S = self.states[jj]
+        F = np.cosh(u)*S[..., 0] + Z*np.sinh(u)*S[..., 1]
+        V = np.sinh(u)/Z*S[..., 0] + np.cosh(u)*S[..., 1]
+        return F, V
+
+    def _toTime(self, spec):
+        """Inverse FFT of spectra, correcting for the exponential window
+
+        :param array spec: spectra (last axis: frequency)
+        """
+        sig = np.fft.irfft(spec, n=self.nfft)[..., :self.nT]
+        return sig*np.exp(self.sigma*self.time)
+
+    def getSignal(self, x, iseg=None, plot=True, Displ=True, time='ms',
+                  figname=None, marker=None):
+        """Get temporal signal at given position on the bar.
+
+        Same output as :meth:`WP2.getSignal`. **x** can also be an array of
+        positions, signals are then arrays of shape (nT, len(x)).
+
+        :param float x: x position of sensor (local coordinates if **iseg** is given, otherwise global)
+        :param int iseg: index of the Segment of the bar where the sensor is (piece of constant impedance for :class:`BarSingle`)
+        :param bool plot: enable graphical output or not
+        :param bool Displ: also return (and plot) displacement
+        :param str time: time scale ('s', 'ms', 'µs')
+        :param str figname: name for the figure
+        :param str marker: marker
+        """
+        xx = np.asarray(x, dtype=float)
+        if iseg is not None:
+            xx = xx + self.xseg[iseg]
+        F, V = [self._toTime(sp).T for sp in self.state(xx)]
+        D = np.cumsum(V, axis=0)*self.dt  # same integration as WP2.compDispl
+        if xx.ndim==0:
+            F, V, D = F[:, 0], V[:, 0], D[:, 0]
+            iseg = int(self.owner[np.clip(np.searchsorted(self.xo, xx, side='right')-1, 0, len(self.L)-1)])
+        nsbp = 3 if Displ else 2
+
+        stime, xlab = scaleTime(self.time, scale=time)
+
+        if plot:
+            plt.figure(figname)
+            ax1 = plt.subplot(nsbp, 1, 1)
+            plt.axhline(color='0.8')
+            plt.plot(stime, F, 'm', marker=marker)
+            plt.ylabel('Force [N]')
+            plt.title('x = %s m'%xx)
+            plt.box(False)
+
+            plt.subplot(nsbp, 1, 2, sharex=ax1)
+            plt.axhline(color='0.8')
+            plt.plot(stime, V, 'c', marker=marker)
+            plt.ylabel('Velocity [m/s]')
+            plt.box(False)
+
+            if Displ:
+                plt.subplot(nsbp, 1, 3, sharex=ax1)
+                plt.axhline(color='0.8')
+                plt.plot(stime, D, 'g', marker=marker)
+                plt.ylabel('Displacement [m]')
+                plt.box(False)
+            plt.xlabel(xlab)
+
+        if Displ:
+            return F, V, D, (xx, None, iseg)
+        else:
+            return F, V, (xx, None, iseg)
+
+
+def transferMatrix(s, Z, co, L):
+    """Transfer matrix of (force, velocity) along a uniform piece of bar.
+
+    :param array s: complex frequencies (sigma + i omega)
+    :param float Z: impedance
+    :param float co: wave celerity
+    :param float L: length
+    :returns: array of shape (len(s), 2, 2)
+    """
+    u = s*L/co
+    ch = np.cosh(u)
+    sh = np.sinh(u)
+    return np.stack((np.stack((ch, Z*sh), axis=-1),
+                     np.stack((sh/Z, ch), axis=-1)), axis=-2)
+
+
+def _pieces(bar):
+    """Impedance, celerity and length of the pieces of constant properties,
+    and index of the Segment of each piece.
+
+    :param obj bar: :class:`BarSet` or :class:`BarSingle`
+    """
+    if hasattr(bar, 'seg'):
+        # BarSet: continuous Segments, split at the section changes
+        cont = bar.bar_continuous
+        Z, co, L, owner = [], [], [], []
+        for ii, ss in enumerate(bar.seg):
+            if isinstance(ss, ViscoSegment):
+                raise ValueError("Viscoelastic Segment %i is not supported by TransferMatrix"%ii)
+            xz = [(0., cont.Z[ii])]  # beginning and impedance of each piece
+            for jj, ll, dd in getattr(bar, 'sections', []):
+                if jj==ii:
+                    # same as Segment.resetImpedance: new impedance after ll
+                    ll = min(max(ll, 0.), cont.L[ii])
+                    xz = [pp for pp in xz if pp[0]<ll]
+                    xz.append((ll, np.pi*dd**2/4*cont.rho[ii]*cont.co[ii]))
+            xx = np.array([pp[0] for pp in xz] + [cont.L[ii]])
+            zz = np.array([pp[1] for pp in xz])
+            keep = np.hstack((True, zz[1:]!=zz[:-1])) & (np.diff(xx)>0)
+            Z.extend(zz[keep])
+            co.extend([cont.co[ii]]*np.sum(keep))
+            L.extend(np.diff(np.hstack((xx[:-1][keep], xx[-1]))))
+            owner.extend([ii]*np.sum(keep))
+        return (np.array(Z, dtype=float), np.array(co, dtype=float),
+                np.array(L, dtype=float), np.array(owner))
+    # BarSingle: elements of same impedance are merged
+    Z, count = _runs(bar.Z)
+    return Z, bar.co*np.ones(len(Z)), count*bar.dx, np.arange(len(Z))
+
+
+def _runs(Z):
+    """Values and lengths of the runs of equal values
+
+    :param array Z: impedance of the elements
+    """
+    Z = np.asarray(Z, dtype=float)
+    new = np.hstack((True, Z[1:]!=Z[:-1]))
+    return Z[new], np.bincount(np.cumsum(new) - 1)